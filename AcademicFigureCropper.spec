@@ -13,7 +13,8 @@ if not ICON_PATH.exists():
 
 datas = [(str(ICON_PATH), ".")]
 binaries = []
-hiddenimports = ["tkinterdnd2.TkinterDnD"]
+# crop_engine 在窗口显示后才通过 importlib 加载，需要显式声明
+hiddenimports = ["tkinterdnd2.TkinterDnD", "crop_engine"]
 
 for arch_name in ("win-arm64", "win-x64", "win-x86"):
     arch_dir = TKDND_ROOT / arch_name
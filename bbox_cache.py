@@ -0,0 +1,130 @@
+"""内容边界缓存：按文件内容哈希、页码和检测参数持久化检测结果，超出容量时按最近使用淘汰。
+
+检测结果与留白无关，只调整留白后重新处理同一批文件时可以直接复用，
+跳过渲染和像素分析。缓存读写失败时只当作未命中，不影响裁剪本身。
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+CACHE_FILENAME = "bbox_cache.sqlite3"
+DEFAULT_MAX_ENTRIES = 20000
+_HASH_CHUNK_SIZE = 1 << 20
+
+
+def make_key(digest, page_index, params):
+    """缓存键：内容哈希 + 页码（图片为帧序号）+ 检测参数"""
+    return f"{digest}:{page_index}:{params}"
+
+
+class BboxCache:
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.conn = sqlite3.connect(path, timeout=10)
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS bboxes (key TEXT PRIMARY KEY, bbox TEXT, last_used REAL)"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS file_hashes ("
+                "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, digest TEXT, last_used REAL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS bboxes_last_used ON bboxes (last_used)")
+
+    @classmethod
+    def from_settings(cls, settings):
+        """根据处理设置打开缓存；未启用或无法打开时返回 None"""
+        path = settings.get('bbox_cache_path')
+        if not path or settings.get('save_debug_images'):
+            return None
+        try:
+            return cls(path, settings.get('bbox_cache_max_entries') or DEFAULT_MAX_ENTRIES)
+        except sqlite3.Error as exc:
+            print(f"打开边界缓存失败: {exc}")
+            return None
+
+    def close(self):
+        self.conn.close()
+
+    def file_digest(self, path):
+        """计算文件内容哈希；大小和修改时间未变时直接复用上次的结果"""
+        stat = os.stat(path)
+        path_key = os.path.normcase(os.path.abspath(path))
+        now = time.time()
+        try:
+            row = self.conn.execute(
+                "SELECT size, mtime_ns, digest FROM file_hashes WHERE path = ?", (path_key,)
+            ).fetchone()
+            if row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+                with self.conn:
+                    self.conn.execute("UPDATE file_hashes SET last_used = ? WHERE path = ?", (now, path_key))
+                return row[2]
+        except sqlite3.Error:
+            pass
+
+        hasher = hashlib.blake2b(digest_size=20)
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b''):
+                hasher.update(chunk)
+        digest = hasher.hexdigest()
+
+        try:
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO file_hashes VALUES (?, ?, ?, ?, ?)",
+                    (path_key, stat.st_size, stat.st_mtime_ns, digest, now),
+                )
+        except sqlite3.Error:
+            pass
+        return digest
+
+    def get_many(self, keys):
+        """批量查询，返回命中的 {键: 边界}；边界为列表或 None（表示没有内容）"""
+        hits = {}
+        if not keys:
+            return hits
+        try:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self.conn.execute(
+                    f"SELECT key, bbox FROM bboxes WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                hits.update((key, json.loads(bbox)) for key, bbox in rows)
+            if hits:
+                now = time.time()
+                with self.conn:
+                    self.conn.executemany(
+                        "UPDATE bboxes SET last_used = ? WHERE key = ?", [(now, key) for key in hits]
+                    )
+        except sqlite3.Error as exc:
+            print(f"读取边界缓存失败: {exc}")
+        return hits
+
+    def put_many(self, items):
+        """批量写入 {键: 边界}，写入后按最近使用淘汰超出容量的条目"""
+        if not items:
+            return
+        now = time.time()
+        try:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO bboxes VALUES (?, ?, ?)",
+                    [(key, json.dumps(bbox), now) for key, bbox in items.items()],
+                )
+                self._evict("bboxes")
+                self._evict("file_hashes")
+        except sqlite3.Error as exc:
+            print(f"写入边界缓存失败: {exc}")
+
+    def _evict(self, table):
+        count = self.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self.conn.execute(
+                f"DELETE FROM {table} WHERE rowid IN "
+                f"(SELECT rowid FROM {table} ORDER BY last_used LIMIT ?)",
+                (overflow,),
+            )
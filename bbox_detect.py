@@ -0,0 +1,96 @@
+"""内容边界检测：根据亮度阈值找出图像中非白色内容的外接矩形。
+
+掩码按固定大小的行带计算并逐带累积行/列命中向量，只使用整数运算，
+额外内存与行带大小成正比，而不是与整幅图像成正比。
+"""
+import numpy as np
+
+from stage_trace import stage
+
+# PDF渲染结果使用的亮度阈值
+PDF_THRESHOLD = 245
+# 图片使用的亮度阈值与噪点过滤尺寸
+IMAGE_THRESHOLD = 225
+IMAGE_MIN_CONTENT_SIZE = 10
+# 每个行带大约处理的字节数
+BAND_BYTES = 4 << 20
+
+
+def compute_content_mask(np_img, threshold):
+    """根据阈值创建内容掩码，True 表示非白色像素。
+
+    RGB 三通道平均值 < threshold 等价于三通道之和 < 3 * threshold，用整数比较即可。
+    逐通道累加到一个 uint16 数组中，比沿通道轴求和少一次整幅的类型转换，快得多。
+    """
+    if np_img.ndim == 2:
+        return np_img < threshold
+    if np_img.shape[2] >= 3:
+        channel_sum = np_img[:, :, 0].astype(np.uint16)
+        channel_sum += np_img[:, :, 1]
+        channel_sum += np_img[:, :, 2]
+        return channel_sum < 3 * threshold
+    return np_img[:, :, 0] < threshold
+
+
+def band_row_count(width, channels=3):
+    """按 BAND_BYTES 计算每个行带的行数（按整数求和时的 uint16 中间结果估算）"""
+    return max(1, BAND_BYTES // max(1, width * channels * 2))
+
+
+def first_last_true(hits):
+    """返回一维布尔向量中第一个和最后一个 True 的下标，没有则返回 None"""
+    if not hits.any():
+        return None
+    first = int(np.argmax(hits))
+    last = len(hits) - 1 - int(np.argmax(hits[::-1]))
+    return first, last
+
+
+def bounds_from_hits(row_hits, col_hits):
+    """根据行/列命中向量得到 (left, top, right, bottom)，没有内容返回 None"""
+    row_span = first_last_true(row_hits)
+    if row_span is None:
+        return None
+    top, bottom = row_span
+    left, right = first_last_true(col_hits)
+    return left, top, right, bottom
+
+
+def scan_bands(bands, width, height, threshold):
+    """逐个行带累积行/列命中向量并返回内容边界。
+
+    bands 依次产出 (起始行, 行带图像)，行带图像为 uint8 的二维或三维数组。
+    """
+    with stage('mask'):
+        row_hits = np.zeros(height, dtype=bool)
+        col_hits = np.zeros(width, dtype=bool)
+        for y, band in bands:
+            mask = compute_content_mask(band, threshold)
+            row_hits[y:y + mask.shape[0]] = mask.any(axis=1)
+            col_hits |= mask.any(axis=0)
+        return bounds_from_hits(row_hits, col_hits)
+
+
+def scan_content_bounds(np_img, threshold):
+    """按行带扫描整幅图像，返回 (left, top, right, bottom)，坐标包含端点；没有内容返回 None"""
+    height, width = np_img.shape[:2]
+    channels = np_img.shape[2] if np_img.ndim == 3 else 1
+    band_rows = band_row_count(width, channels)
+    bands = ((y, np_img[y:y + band_rows]) for y in range(0, height, band_rows))
+    return scan_bands(bands, width, height, threshold)
+
+
+def detect_content_bbox(np_img, threshold, min_content_size=0):
+    """检测图像内容边界。
+
+    返回 (left, top, right, bottom) 像素坐标（包含端点）；没有内容，
+    或内容宽高不超过 min_content_size 时返回 None。
+    """
+    bounds = scan_content_bounds(np_img, threshold)
+    if bounds is None:
+        return None
+
+    left, top, right, bottom = bounds
+    if min_content_size and ((right - left) <= min_content_size or (bottom - top) <= min_content_size):
+        return None
+    return bounds
@@ -0,0 +1,409 @@
+"""性能基准：生成可复现的合成语料，用裁剪引擎逐个处理并统计吞吐量、每页用时和峰值内存。
+
+示例:
+    python benchmark.py                          # 生成语料并运行，结果写入 benchmark_results/
+    python benchmark.py --scale 0.25 --repeat 3  # 缩小语料，重复 3 轮
+    python benchmark.py --detect-mode vector --save-profile compact -o result.json
+
+语料由固定随机种子生成，相同参数生成的文件内容一致；语料目录中已有相同参数
+生成的语料时直接复用。结果为 JSON，便于在不同提交之间对比。
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz  # PyMuPDF
+import numpy as np
+from PIL import Image
+
+import crop_engine
+
+# 语料清单文件名，记录生成参数，参数一致时复用已有语料
+MANIFEST_FILENAME = "manifest.json"
+# 语料格式版本，生成逻辑变化时递增，使旧语料失效
+CORPUS_VERSION = 1
+
+# 各类语料在 scale=1 时的文件数
+CORPUS_COUNTS = {
+    'vector_plot': 8,
+    'embedded_raster': 6,
+    'huge_tiff': 2,
+    'multi_page': 2,
+    'tight': 6,
+}
+# 多页PDF的页数（不低于按页段并行的阈值）
+MULTI_PAGE_COUNT = 40
+# 超大TIFF的尺寸（检测时逐行带转换为RGB）
+HUGE_TIFF_SIZE = (6000, 4000)
+
+
+def random_content_rect(rng, width, height, min_ratio=0.3):
+    """在页面内随机取一个内容区域，四周留出随机宽度的白边"""
+    content_w = rng.uniform(min_ratio, 0.9) * width
+    content_h = rng.uniform(min_ratio, 0.9) * height
+    x0 = rng.uniform(0, width - content_w)
+    y0 = rng.uniform(0, height - content_h)
+    return fitz.Rect(x0, y0, x0 + content_w, y0 + content_h)
+
+
+def save_pdf(doc, path, **options):
+    """保存时去掉创建时间和文件ID，使相同参数生成的PDF逐字节一致"""
+    doc.set_metadata({})
+    doc.save(path, no_new_id=True, **options)
+    doc.close()
+
+
+def draw_vector_plot(page, rng, area):
+    """在指定区域画一幅类似 matplotlib 导出的折线图：坐标轴、刻度、折线和文字"""
+    shape = page.new_shape()
+    shape.draw_rect(area)
+    shape.finish(color=(0, 0, 0), width=0.8)
+
+    for i in range(1, 6):
+        x = area.x0 + area.width * i / 6
+        shape.draw_line((x, area.y1), (x, area.y1 - 4))
+        y = area.y0 + area.height * i / 6
+        shape.draw_line((area.x0, y), (area.x0 + 4, y))
+    shape.finish(color=(0, 0, 0), width=0.6)
+
+    for series in range(3):
+        points = []
+        level = rng.uniform(0.2, 0.8)
+        for i in range(60):
+            level = min(0.95, max(0.05, level + rng.uniform(-0.08, 0.08)))
+            points.append(fitz.Point(area.x0 + area.width * i / 59, area.y1 - area.height * level))
+        shape.draw_polyline(points)
+        shape.finish(color=(rng.random() * 0.8, rng.random() * 0.8, rng.random() * 0.8), width=1.2, closePath=False)
+    shape.commit()
+
+    page.insert_text((area.x0 + 6, area.y0 + 14), f"Figure {rng.randint(1, 99)}", fontsize=10)
+
+
+def make_raster_array(rng, width, height):
+    """生成带噪声的彩色图块，模拟截图或显微照片"""
+    np_rng = np.random.default_rng(rng.randrange(1 << 32))
+    base = np_rng.integers(0, 200, size=(height // 8 + 1, width // 8 + 1, 3), dtype=np.uint8)
+    tile = np.repeat(np.repeat(base, 8, axis=0), 8, axis=1)[:height, :width]
+    noise = np_rng.integers(0, 40, size=(height, width, 3), dtype=np.uint8)
+    return np.ascontiguousarray(tile + noise)
+
+
+def write_vector_plot(path, rng):
+    doc = fitz.open()
+    page = doc.new_page(width=rng.choice((360, 432, 504)), height=rng.choice((252, 288, 324)))
+    draw_vector_plot(page, rng, random_content_rect(rng, page.rect.width, page.rect.height, 0.5))
+    save_pdf(doc, path)
+
+
+def write_embedded_raster(path, rng):
+    doc = fitz.open()
+    page = doc.new_page(width=612, height=792)
+    area = random_content_rect(rng, page.rect.width, page.rect.height, 0.4)
+    pixels = make_raster_array(rng, int(area.width * 2), int(area.height * 2))
+    pix = fitz.Pixmap(fitz.csRGB, pixels.shape[1], pixels.shape[0], pixels.tobytes(), False)
+    page.insert_image(area, pixmap=pix)
+    page.insert_text((area.x0, area.y1 + 14), "Embedded raster", fontsize=9)
+    save_pdf(doc, path, deflate=True)
+
+
+def write_huge_tiff(path, rng):
+    width, height = HUGE_TIFF_SIZE
+    img = Image.new('RGB', (width, height), (255, 255, 255))
+    x0, y0 = rng.randint(200, 900), rng.randint(200, 900)
+    x1, y1 = width - rng.randint(200, 900), height - rng.randint(200, 900)
+    block = make_raster_array(rng, (x1 - x0) // 4, (y1 - y0) // 4)
+    img.paste(Image.fromarray(block).resize((x1 - x0, y1 - y0), Image.NEAREST), (x0, y0))
+    img.save(path, compression='tiff_lzw')
+    img.close()
+
+
+def write_multi_page(path, rng):
+    doc = fitz.open()
+    for _ in range(MULTI_PAGE_COUNT):
+        page = doc.new_page(width=432, height=288)
+        draw_vector_plot(page, rng, random_content_rect(rng, page.rect.width, page.rect.height, 0.5))
+    save_pdf(doc, path)
+
+
+def write_tight(path, rng):
+    """已经裁剪好的图：内容贴着页面边缘，裁剪结果应与原图基本一致"""
+    if path.endswith('.png'):
+        width, height = rng.randint(800, 1600), rng.randint(600, 1200)
+        Image.fromarray(make_raster_array(rng, width, height)).save(path)
+        return
+
+    doc = fitz.open()
+    page = doc.new_page(width=360, height=240)
+    draw_vector_plot(page, rng, page.rect + (0.5, 0.5, -0.5, -0.5))
+    save_pdf(doc, path)
+
+
+def corpus_plan(scale):
+    """按比例得到 (类别, 文件名, 生成函数) 列表，每类至少一个文件"""
+    writers = {
+        'vector_plot': (write_vector_plot, '.pdf'),
+        'embedded_raster': (write_embedded_raster, '.pdf'),
+        'huge_tiff': (write_huge_tiff, '.tif'),
+        'multi_page': (write_multi_page, '.pdf'),
+        'tight': (write_tight, None),
+    }
+    plan = []
+    for category, count in CORPUS_COUNTS.items():
+        writer, ext = writers[category]
+        for i in range(max(1, round(count * scale))):
+            file_ext = ext or ('.png' if i % 2 else '.pdf')
+            plan.append((category, f"{category}_{i:03d}{file_ext}", writer))
+    return plan
+
+
+def generate_corpus(corpus_dir, seed, scale):
+    """生成语料并返回 [(类别, 路径)]；目录中已有相同参数生成的语料时直接复用"""
+    spec = {'version': CORPUS_VERSION, 'seed': seed, 'scale': scale}
+    plan = corpus_plan(scale)
+    manifest_path = os.path.join(corpus_dir, MANIFEST_FILENAME)
+    entries = [(category, os.path.join(corpus_dir, name)) for category, name, _ in plan]
+
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            if json.load(f) == spec and all(os.path.exists(path) for _, path in entries):
+                return entries
+    except (OSError, ValueError):
+        pass
+
+    if os.path.isdir(corpus_dir):
+        shutil.rmtree(corpus_dir)
+    os.makedirs(corpus_dir)
+    for category, name, writer in plan:
+        # 每个文件使用独立的随机数序列，单独增减某类文件不会影响其他文件的内容
+        writer(os.path.join(corpus_dir, name), random.Random(f"{seed}:{name}"))
+
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(spec, f)
+    return entries
+
+
+def count_pages(path):
+    """PDF返回页数，图片按 1 页计"""
+    if path.lower().endswith('.pdf'):
+        with fitz.open(path) as doc:
+            return doc.page_count
+    return 1
+
+
+def peak_rss_bytes():
+    """当前进程的峰值常驻内存，无法获取时返回 None"""
+    try:
+        import resource
+    except ImportError:
+        resource = None
+
+    if resource is not None:
+        # Linux 上 ru_maxrss 单位为 KB，macOS 上为字节
+        unit = 1 if sys.platform == 'darwin' else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit
+
+    if sys.platform == 'win32':
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [
+                ('cb', wintypes.DWORD),
+                ('PageFaultCount', wintypes.DWORD),
+                ('PeakWorkingSetSize', ctypes.c_size_t),
+                ('WorkingSetSize', ctypes.c_size_t),
+                ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                ('PagefileUsage', ctypes.c_size_t),
+                ('PeakPagefileUsage', ctypes.c_size_t),
+            ]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        get_process = ctypes.windll.kernel32.GetCurrentProcess
+        if ctypes.windll.psapi.GetProcessMemoryInfo(get_process(), ctypes.byref(counters), counters.cb):
+            return counters.PeakWorkingSetSize
+    return None
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else None
+
+
+def summarize(samples, elapsed):
+    """samples 为 (页数, 用时) 列表。
+
+    没有逐页计时：每个文件的用时除以页数得到该文件的平均每页用时，p50/p95 是这些
+    文件平均值的分位数（每个文件一个样本），不是逐页延迟的分位数。
+    """
+    page_means = [seconds / pages for pages, seconds in samples]
+    total_pages = sum(pages for pages, _ in samples)
+    return {
+        'files': len(samples),
+        'pages': total_pages,
+        'seconds': round(elapsed, 4),
+        'files_per_second': round(len(samples) / elapsed, 3) if elapsed else None,
+        'pages_per_second': round(total_pages / elapsed, 3) if elapsed else None,
+        'file_mean_page_ms_p50': round(percentile(page_means, 50) * 1000, 3) if page_means else None,
+        'file_mean_page_ms_p95': round(percentile(page_means, 95) * 1000, 3) if page_means else None,
+    }
+
+
+def run_category(paths, settings, repeat):
+    """在当前进程中逐个裁剪一类语料（不使用边界缓存），返回 (样本, 失败列表, 用时, 峰值内存)"""
+    page_counts = {path: count_pages(path) for path in paths}
+    samples = []
+    failures = []
+    started = time.perf_counter()
+
+    for round_index in range(repeat):
+        output_names = crop_engine.OutputNameIndex(settings['output_dir'])
+        for path in paths:
+            output_path = crop_engine.build_output_path(path, settings, output_names)
+            file_started = time.perf_counter()
+            try:
+                crop_engine.crop_file(path, output_path, settings)
+            except Exception as e:
+                failures.append({'file': os.path.basename(path), 'round': round_index, 'error': str(e)})
+                continue
+            samples.append((page_counts[path], time.perf_counter() - file_started))
+
+    return samples, failures, time.perf_counter() - started, peak_rss_bytes()
+
+
+def run_benchmark(entries, settings, repeat):
+    """每类语料在一个新的子进程中运行，分别得到各类的峰值内存；返回总体和分类统计"""
+    paths_by_category = {}
+    for category, path in entries:
+        paths_by_category.setdefault(category, []).append(path)
+
+    categories = {}
+    all_samples = []
+    failures = []
+    elapsed = 0
+    peak_rss = None
+    for category, paths in paths_by_category.items():
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            samples, category_failures, seconds, category_peak = executor.submit(
+                run_category, paths, settings, repeat
+            ).result()
+        categories[category] = dict(summarize(samples, seconds), peak_rss_bytes=category_peak)
+        all_samples.extend(samples)
+        failures.extend(category_failures)
+        elapsed += seconds
+        if category_peak is not None:
+            peak_rss = max(peak_rss or 0, category_peak)
+
+    return {
+        'peak_rss_bytes': peak_rss,
+        'overall': summarize(all_samples, elapsed),
+        'categories': categories,
+        'failures': failures,
+    }
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="benchmark.py", description="裁剪引擎性能基准。")
+    parser.add_argument("--corpus-dir", default=os.path.join(tempfile.gettempdir(), "afc_benchmark_corpus"),
+                        help="语料目录，默认在系统临时目录下")
+    parser.add_argument("--seed", type=int, default=20240501, help="语料随机种子")
+    parser.add_argument("--scale", type=float, default=1.0, help="语料规模系数，每类至少生成一个文件")
+    parser.add_argument("--repeat", type=int, default=1, help="重复运行的轮数")
+    parser.add_argument("--detect-mode", choices=("raster", "vector"), default="raster", help="PDF 内容检测方式")
+    parser.add_argument("--output-mode", choices=("rebuild", "cropbox"), default="rebuild", help="PDF 输出方式")
+    parser.add_argument("--save-profile", choices=tuple(crop_engine.PDF_SAVE_PROFILES),
+                        default=crop_engine.DEFAULT_PDF_SAVE_PROFILE, help="PDF 保存方案")
+    parser.add_argument("-o", "--output", help="结果 JSON 路径，默认写入 benchmark_results/ 并以时间命名")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    # 语料在子进程中生成，裁剪时每类语料也各用一个新的子进程，生成和其他类语料的内存
+    # 不会计入某一类的峰值
+    generate_started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        entries = executor.submit(generate_corpus, args.corpus_dir, args.seed, args.scale).result()
+    generate_seconds = time.perf_counter() - generate_started
+
+    output_dir = tempfile.mkdtemp(prefix="afc_benchmark_output_")
+    settings = {
+        'overwrite_original': False,
+        'output_dir': output_dir,
+        'margins': {'left': 2, 'right': 2, 'top': 2, 'bottom': 2},
+        'save_debug_images': False,
+        'pdf_detect_mode': args.detect_mode,
+        'pdf_output_mode': args.output_mode,
+        'pdf_save_profile': args.save_profile,
+        'worker_count': 1,
+        'bbox_cache_path': '',
+    }
+
+    try:
+        results = run_benchmark(entries, settings, max(1, args.repeat))
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+    report = {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'pymupdf': fitz.VersionBind,
+            'pillow': Image.__version__,
+            'numpy': np.__version__,
+        },
+        'corpus': {
+            'seed': args.seed,
+            'scale': args.scale,
+            'version': CORPUS_VERSION,
+            'files': len(entries),
+            'generate_seconds': round(generate_seconds, 3),
+        },
+        'settings': {
+            'repeat': args.repeat,
+            'pdf_detect_mode': args.detect_mode,
+            'pdf_output_mode': args.output_mode,
+            'pdf_save_profile': args.save_profile,
+        },
+        **results,
+    }
+
+    output_path = args.output
+    if not output_path:
+        stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_path = os.path.join("benchmark_results", f"benchmark_{stamp}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    overall = report['overall']
+    peak_rss = report['peak_rss_bytes']
+    print(f"{overall['files']} 个文件 / {overall['pages']} 页, 用时 {overall['seconds']:.2f}s")
+    print(f"吞吐量: {overall['pages_per_second']} 页/s, {overall['files_per_second']} 文件/s")
+    print(f"各文件平均每页用时: p50 {overall['file_mean_page_ms_p50']} ms, p95 {overall['file_mean_page_ms_p95']} ms")
+    if peak_rss is not None:
+        print(f"峰值内存: {peak_rss / (1 << 20):.1f} MB（各类语料中的最大值）")
+    for category, stats in report['categories'].items():
+        if stats['peak_rss_bytes'] is not None:
+            print(f"  {category}: {stats['pages_per_second']} 页/s, 峰值内存 {stats['peak_rss_bytes'] / (1 << 20):.1f} MB")
+    for failure in report['failures']:
+        print(f"失败 {failure['file']}: {failure['error']}", file=sys.stderr)
+    print(f"结果已保存到: {output_path}")
+    return 1 if report['failures'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
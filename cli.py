@@ -0,0 +1,249 @@
+"""命令行批处理入口，不加载 tkinter / tkinterdnd2，可在无显示环境的构建服务器上运行。
+
+示例:
+    python cli.py figures/*.pdf -o cropped --margin 2
+    python cli.py figures/ --overwrite
+    python cli.py figures/ -o cropped --watch
+"""
+import argparse
+import glob
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+import crop_engine
+from bbox_cache import CACHE_FILENAME
+from config_paths import get_config_path
+from file_discovery import is_supported_file, iter_directory_files
+from folder_watch import DEFAULT_INTERVAL, DEFAULT_SETTLE_SECONDS, FolderWatcher
+from stage_trace import TRACE_FILENAME, append_trace, summarize_trace
+
+# 退出码
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+
+
+def collect_input_files(inputs, exclude_dirs=()):
+    """展开文件、通配符和目录（递归），返回 (支持的文件列表, 没有匹配的输入列表)。
+
+    遍历目录时跳过 exclude_dirs（例如位于输入目录内的输出目录）。
+    """
+    files = []
+    seen = set()
+    unmatched = []
+
+    def add(path):
+        key = os.path.normcase(os.path.abspath(path))
+        if key not in seen and is_supported_file(path, crop_engine.SUPPORTED_IMG_FORMATS):
+            seen.add(key)
+            files.append(path)
+
+    for item in inputs:
+        if glob.has_magic(item):
+            matches = sorted(glob.glob(item, recursive=True))
+        else:
+            matches = [item] if os.path.exists(item) else []
+
+        if not matches:
+            unmatched.append(item)
+            continue
+
+        for match in matches:
+            if os.path.isdir(match):
+                for file_path in iter_directory_files(match, crop_engine.SUPPORTED_IMG_FORMATS, exclude_dirs):
+                    add(file_path)
+            else:
+                add(match)
+
+    return files, unmatched
+
+
+def percentile_value(text):
+    """argparse 的参数类型：0～100 之间的分位数"""
+    value = float(text)
+    if not 0 <= value <= 100:
+        raise argparse.ArgumentTypeError(f"分位数必须在 0～100 之间: {text}")
+    return value
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="cli.py",
+        description="批量裁剪 PDF 和图片的白边（无界面模式）。",
+    )
+    parser.add_argument("inputs", nargs="+", help="要处理的文件、通配符或目录（目录会递归查找）")
+
+    output_group = parser.add_mutually_exclusive_group(required=True)
+    output_group.add_argument("--overwrite", action="store_true", help="直接覆盖原文件")
+    output_group.add_argument("-o", "--output-dir", help="输出目录，同名文件会自动追加后缀")
+
+    parser.add_argument("--margin", type=int, default=0, help="四边统一留白 (px)，默认 0")
+    parser.add_argument("--left", type=int, help="左侧留白，覆盖 --margin")
+    parser.add_argument("--right", type=int, help="右侧留白，覆盖 --margin")
+    parser.add_argument("--top", type=int, help="上侧留白，覆盖 --margin")
+    parser.add_argument("--bottom", type=int, help="下侧留白，覆盖 --margin")
+
+    parser.add_argument("--detect-mode", choices=("raster", "vector"), default="raster", help="PDF 内容检测方式")
+    parser.add_argument(
+        "--output-mode", choices=("rebuild", "cropbox"), default="rebuild",
+        help="PDF 输出方式：rebuild 重建页面，cropbox 只改写页面框（更快、文件更小）",
+    )
+    parser.add_argument(
+        "--page-crop", choices=crop_engine.PDF_PAGE_CROP_MODES, default="per_page",
+        help="多页 PDF 的裁剪方式：per_page 每页单独裁剪，union / percentile 所有页面统一裁剪（只做一遍低分辨率检测）",
+    )
+    parser.add_argument("--percentile", type=percentile_value, default=crop_engine.DEFAULT_UNIFORM_PERCENTILE,
+                        help="--page-crop percentile 时每条边取各页的分位数（0～100，0 表示使用默认值）")
+    parser.add_argument(
+        "--save-profile", choices=tuple(crop_engine.PDF_SAVE_PROFILES), default=crop_engine.DEFAULT_PDF_SAVE_PROFILE,
+        help="PDF 保存方案：fast 写入最快，compact 去重并压缩，archival 压缩最充分",
+    )
+    parser.add_argument(
+        "--frame-crop", choices=("union", "per_frame"), default="union",
+        help="多帧 TIFF/GIF 的裁剪方式：union 所有帧统一裁剪，per_frame 每帧单独裁剪（仅 TIFF）",
+    )
+    parser.add_argument("--precision", type=float, default=0,
+                        help="PDF 检测精度（pt），一个渲染像素对应的页面尺寸，0 表示默认 1/3 pt")
+    parser.add_argument("--max-megapixels", type=float, default=0,
+                        help="PDF 精确检测时整页渲染的像素数上限（百万像素），0 表示默认 40")
+    parser.add_argument(
+        "--render-profile", choices=("accurate", "fast"), default="accurate",
+        help="PDF 检测渲染方案：fast 不渲染注释并降低精修时的抗锯齿级别",
+    )
+    parser.add_argument("-j", "--workers", type=int, default=0, help="工作进程数，0 表示使用全部 CPU 核心")
+    parser.add_argument("--band-mb", type=int, default=0,
+                        help="渲染超大页面时单个行带的内存上限（MB），0 表示使用默认值 64")
+    parser.add_argument("--no-cache", action="store_true", help="不使用边界缓存，每次都重新检测")
+    parser.add_argument("--trace", action="store_true", help="记录各处理阶段的耗时和内存峰值，追加写入配置目录下的 stage_trace.jsonl")
+    parser.add_argument("--debug-images", action="store_true", help="保存 PDF 页面分析的调试图像")
+    parser.add_argument("--watch", action="store_true", help="持续监视输入的文件夹，新增或修改的文件写完后自动裁剪")
+    parser.add_argument("--watch-interval", type=float, default=DEFAULT_INTERVAL, help="监视时的扫描间隔（秒）")
+    parser.add_argument("--settle", type=float, default=DEFAULT_SETTLE_SECONDS,
+                        help="文件大小和修改时间保持不变多久后才认为已写完（秒）")
+    parser.add_argument("-q", "--quiet", action="store_true", help="只输出失败信息和汇总")
+    return parser
+
+
+def build_settings(args):
+    """构造与 PDFCropperApp.get_processing_settings 相同结构的设置"""
+    def margin(value):
+        return max(0, args.margin if value is None else value)
+
+    return {
+        'overwrite_original': args.overwrite,
+        'output_dir': args.output_dir or '',
+        'margins': {
+            'left': margin(args.left),
+            'right': margin(args.right),
+            'top': margin(args.top),
+            'bottom': margin(args.bottom),
+        },
+        'save_debug_images': args.debug_images,
+        'pdf_detect_mode': args.detect_mode,
+        'detect_precision_pt': args.precision,
+        'detect_max_megapixels': args.max_megapixels,
+        'detect_render_profile': args.render_profile,
+        'pdf_output_mode': args.output_mode,
+        'pdf_page_crop': args.page_crop,
+        'pdf_uniform_percentile': args.percentile,
+        'pdf_save_profile': args.save_profile,
+        'image_frame_crop': args.frame_crop,
+        'worker_count': args.workers,
+        'render_band_mb': args.band_mb,
+        'bbox_cache_path': '' if args.no_cache else get_config_path(CACHE_FILENAME),
+        'stage_trace': args.trace,
+    }
+
+
+def run_batch(files, settings, args, watcher=None):
+    """裁剪一批文件并输出结果和汇总，返回失败的文件数"""
+    started = time.perf_counter()
+    total_success = 0
+    total_failed = 0
+    output_names = crop_engine.OutputNameIndex(settings['output_dir'])
+    file_stats = []
+    jobs = [
+        (file_path, crop_engine.build_output_path(file_path, settings, output_names))
+        for file_path in files
+    ]
+
+    worker_count = crop_engine.resolve_worker_count(settings['worker_count'], len(jobs))
+    results = crop_engine.run_crop_jobs(jobs, settings, worker_count)
+    for i, (file_path, output_path, error, stats) in enumerate(results):
+        if watcher is not None:
+            watcher.mark_done(file_path)
+        if error is None:
+            total_success += 1
+            if stats:
+                file_stats.append(stats)
+            if not args.quiet:
+                print(f"[{i + 1}/{len(jobs)}] {file_path} -> {output_path}")
+        else:
+            total_failed += 1
+            print(f"[{i + 1}/{len(jobs)}] 失败 {file_path}: {error}", file=sys.stderr)
+
+    elapsed = time.perf_counter() - started
+    print(f"处理完成: {total_success} 成功, {total_failed} 失败, 用时 {elapsed:.1f}s")
+    save_summary = crop_engine.summarize_save_stats(settings['pdf_save_profile'], file_stats)
+    if save_summary:
+        print(save_summary)
+    if args.trace:
+        trace_records = [record for stats in file_stats for record in stats.get('trace', [])]
+        trace_path = get_config_path(TRACE_FILENAME)
+        try:
+            append_trace(trace_path, trace_records)
+        except OSError as exc:
+            print(f"写入阶段跟踪失败: {exc}", file=sys.stderr)
+        else:
+            print(f"{summarize_trace(trace_records)}（详细记录: {trace_path}）")
+    return total_failed
+
+
+def watch_folders(folders, settings, args):
+    """监视文件夹直到按下 Ctrl+C，已有的文件不处理"""
+    exclude_dirs = () if settings['overwrite_original'] else (settings['output_dir'],)
+    watcher = FolderWatcher(folders, crop_engine.SUPPORTED_IMG_FORMATS, exclude_dirs, args.settle)
+    print(f"正在监视: {', '.join(folders)}（按 Ctrl+C 停止）")
+    try:
+        watcher.run(lambda files: run_batch(files, settings, args, watcher), threading.Event(), args.watch_interval)
+    except KeyboardInterrupt:
+        print("已停止监视")
+    return EXIT_OK
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    settings = build_settings(args)
+
+    if args.watch:
+        not_dirs = [item for item in args.inputs if not os.path.isdir(item)]
+        if not_dirs:
+            print(f"监视模式只接受文件夹: {', '.join(not_dirs)}", file=sys.stderr)
+            return EXIT_USAGE
+    else:
+        exclude_dirs = () if settings['overwrite_original'] else (settings['output_dir'],)
+        files, unmatched = collect_input_files(args.inputs, exclude_dirs)
+        for item in unmatched:
+            print(f"未找到: {item}", file=sys.stderr)
+        if not files:
+            print("没有检测到支持的文件", file=sys.stderr)
+            return EXIT_USAGE
+
+    if not settings['overwrite_original']:
+        try:
+            os.makedirs(settings['output_dir'], exist_ok=True)
+        except OSError as exc:
+            print(f"无法创建输出文件夹: {exc}", file=sys.stderr)
+            return EXIT_USAGE
+
+    if args.watch:
+        return watch_folders(args.inputs, settings, args)
+    return EXIT_OK if run_batch(files, settings, args) == 0 else EXIT_FAILED
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,29 @@
+"""配置文件路径解析，不依赖界面库，供界面、命令行和工作进程共用。"""
+import os
+
+
+def get_config_path(filename):
+    """Resolve a writable config path for both source and packaged runs."""
+    candidate_dirs = []
+    local_appdata = os.environ.get("LOCALAPPDATA")
+    if local_appdata:
+        candidate_dirs.append(os.path.join(local_appdata, "AcademicFigureCropper"))
+
+    home_dir = os.path.expanduser("~")
+    if home_dir:
+        candidate_dirs.append(os.path.join(home_dir, ".academic_figure_cropper"))
+
+    candidate_dirs.append(os.path.abspath("."))
+
+    for directory in candidate_dirs:
+        try:
+            os.makedirs(directory, exist_ok=True)
+            probe_path = os.path.join(directory, ".write_test")
+            with open(probe_path, "w", encoding="utf-8") as probe_file:
+                probe_file.write("ok")
+            os.remove(probe_path)
+            return os.path.join(directory, filename)
+        except OSError:
+            continue
+
+    return os.path.join(os.path.abspath("."), filename)
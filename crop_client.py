@@ -0,0 +1,173 @@
+"""常驻裁剪服务（crop_server.py）的客户端：把裁剪任务发给服务，并以 JSON 输出结果。
+
+只依赖标准库，不导入 PyMuPDF / numpy，每次调用的开销只有 Python 解释器本身的
+启动时间，适合在论文编译流程中为每张图调用一次。服务没有运行时以退出码 3
+结束，构建脚本可以据此退回 cli.py。
+
+每个请求都附带服务启动时写入配置目录的访问令牌（crop_server_token），只有能读取
+该文件的本机用户才能提交任务。
+
+示例:
+    python crop_client.py figures/plot.pdf --output-file build/plot.pdf --margin 2
+    python crop_client.py figures/ -o cropped --settings '{"pdf_detect_mode": "vector"}'
+    python crop_client.py --ping
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+
+from config_paths import get_config_path
+
+# 服务默认监听的本机地址和端口
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 47615
+# 访问令牌文件名，位于配置目录中
+TOKEN_FILENAME = 'crop_server_token'
+
+# 退出码，0～2 与 cli.py 一致
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_UNAVAILABLE = 3
+
+
+def connect(port=DEFAULT_PORT, socket_path=None, timeout=None):
+    """连接服务：指定 socket_path 时使用 Unix 套接字，否则连接本机端口"""
+    if socket_path:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(timeout)
+            sock.connect(socket_path)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+    return socket.create_connection((DEFAULT_HOST, port), timeout)
+
+
+def read_token(path):
+    """读取访问令牌，文件不存在时返回空字符串"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return ''
+
+
+def send_request(request, port=DEFAULT_PORT, socket_path=None, timeout=None):
+    """发送一个请求（一行 JSON），返回服务的响应字典"""
+    with connect(port, socket_path, timeout) as sock:
+        sock.sendall(json.dumps(request, ensure_ascii=False).encode('utf-8') + b'\n')
+        with sock.makefile('rb') as f:
+            line = f.readline()
+    if not line:
+        raise ConnectionError("服务没有返回结果")
+    return json.loads(line)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="crop_client.py",
+        description="把裁剪任务发给常驻的裁剪服务（crop_server.py），结果以 JSON 输出到标准输出。",
+    )
+    parser.add_argument("inputs", nargs="*", help="要处理的文件、通配符或目录，由服务展开")
+
+    output_group = parser.add_mutually_exclusive_group()
+    output_group.add_argument("--overwrite", action="store_true", help="直接覆盖原文件")
+    output_group.add_argument("-o", "--output-dir", help="输出目录，同名文件会自动追加后缀")
+    output_group.add_argument("--output-file", help="只有一个输入文件时，直接指定输出文件路径")
+
+    parser.add_argument("--margin", type=int, help="四边统一留白 (px)，覆盖 --settings 中的 margins")
+    parser.add_argument("--settings", help="处理设置的 JSON（与界面的处理设置结构相同），以 @ 开头时从文件读取")
+
+    command_group = parser.add_mutually_exclusive_group()
+    command_group.add_argument("--ping", action="store_true", help="检查服务是否在运行")
+    command_group.add_argument("--shutdown", action="store_true", help="停止服务")
+
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"服务监听的本机端口，默认 {DEFAULT_PORT}")
+    parser.add_argument("--socket", help="服务监听的 Unix 套接字路径，指定后不使用端口")
+    parser.add_argument("--token-file", help="访问令牌文件，默认为配置目录下的 crop_server_token")
+    parser.add_argument("--timeout", type=float, help="等待结果的最长时间（秒），默认一直等待")
+    return parser
+
+
+def load_settings(text):
+    if text is None:
+        return {}
+    if text.startswith('@'):
+        with open(text[1:], 'r', encoding='utf-8') as f:
+            text = f.read()
+    settings = json.loads(text)
+    if not isinstance(settings, dict):
+        raise ValueError("--settings 必须是 JSON 对象")
+    return settings
+
+
+def build_request(args, parser):
+    """根据命令行参数构造请求；路径都转换为绝对路径，服务的工作目录与客户端无关"""
+    if args.ping or args.shutdown:
+        return {'command': 'ping' if args.ping else 'shutdown'}
+    if not args.inputs:
+        parser.error("需要至少一个输入")
+
+    try:
+        settings = load_settings(args.settings)
+    except (OSError, ValueError) as exc:
+        parser.error(f"无法读取 --settings: {exc}")
+    if args.margin is not None:
+        settings['margins'] = {side: max(0, args.margin) for side in ('left', 'right', 'top', 'bottom')}
+    if args.overwrite:
+        settings['overwrite_original'] = True
+    elif args.output_dir:
+        settings['overwrite_original'] = False
+        settings['output_dir'] = os.path.abspath(args.output_dir)
+    elif settings.get('output_dir'):
+        settings['output_dir'] = os.path.abspath(settings['output_dir'])
+
+    if args.output_file:
+        if len(args.inputs) != 1:
+            parser.error("--output-file 只能用于一个输入文件")
+        settings['overwrite_original'] = False
+        files = [{'input': os.path.abspath(args.inputs[0]), 'output': os.path.abspath(args.output_file)}]
+    else:
+        files = [os.path.abspath(item) for item in args.inputs]
+    return {'command': 'crop', 'files': files, 'settings': settings}
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    request = build_request(args, parser)
+
+    token_path = args.token_file or get_config_path(TOKEN_FILENAME)
+    try:
+        request['token'] = read_token(token_path)
+    except OSError as exc:
+        print(f"无法读取访问令牌: {exc}", file=sys.stderr)
+        return EXIT_UNAVAILABLE
+    if not request['token']:
+        print(f"找不到访问令牌 {token_path}，服务可能没有启动", file=sys.stderr)
+        return EXIT_UNAVAILABLE
+
+    try:
+        response = send_request(request, args.port, args.socket, args.timeout)
+    except (OSError, ValueError) as exc:
+        print(f"无法连接裁剪服务: {exc}", file=sys.stderr)
+        return EXIT_UNAVAILABLE
+
+    print(json.dumps(response, ensure_ascii=False, indent=2))
+    for result in response.get('results', []):
+        if not result['ok']:
+            print(f"失败 {result['input']}: {result['error']}", file=sys.stderr)
+    if response.get('ok'):
+        return EXIT_OK
+    if 'error' in response:
+        print(response['error'], file=sys.stderr)
+        return EXIT_USAGE
+    return EXIT_FAILED
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,906 @@
+"""裁剪引擎：PDF和图片白边裁剪的具体实现，不依赖任何界面库，可在工作进程中运行。"""
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager, nullcontext
+
+import fitz  # PyMuPDF
+import numpy as np
+from PIL import Image, TiffImagePlugin
+
+from bbox_detect import IMAGE_MIN_CONTENT_SIZE, IMAGE_THRESHOLD, PDF_THRESHOLD
+from bbox_cache import BboxCache, make_key
+from debug_writer import PREVIEW_MAX_SIDE, DebugWriter
+from image_analysis import crop_rgb, detect_image_bounds
+from page_analysis import (
+    COARSE_SCALE,
+    COARSE_THRESHOLD,
+    DEFAULT_RENDER_PROFILE,
+    DETECT_PIXEL_BUDGET,
+    DETECT_ZOOM,
+    RENDER_BAND_BYTES,
+    UNIFORM_ZOOM,
+    VECTOR_DETECT_VERSION,
+    analyze_page,
+    analyze_page_lowres,
+    detect_zoom,
+    render_page_array,
+)
+from stage_trace import StageTracer, add_records, stage
+
+# 支持的图片格式
+SUPPORTED_IMG_FORMATS = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif', '.gif')
+
+# 页数达到该值的PDF才按页段并行分析
+PAGE_PARALLEL_MIN_PAGES = 16
+# 每个页段的最少页数，避免进程间调度开销超过分析本身
+PAGE_CHUNK_MIN_SIZE = 4
+
+# PDF保存方案：fast 与原先的默认保存一致；compact 去重共享资源、压缩流并使用对象流；
+# archival 在 compact 的基础上压缩图片/字体并清理内容流，不使用对象流以兼容旧阅读器
+PDF_SAVE_PROFILES = {
+    'fast': {},
+    'compact': {'garbage': 3, 'deflate': True, 'use_objstms': 1},
+    'archival': {
+        'garbage': 4, 'deflate': True, 'deflate_images': True, 'deflate_fonts': True, 'clean': True,
+    },
+}
+DEFAULT_PDF_SAVE_PROFILE = 'fast'
+
+# 多页PDF的裁剪方式：per_page 每页按自己的内容区域裁剪；union / percentile 先对所有页面
+# 做一遍低分辨率检测，再把各页内容区域合并为一个统一的裁剪区域
+PDF_PAGE_CROP_MODES = ('per_page', 'union', 'percentile')
+# percentile 方式下每条边取各页的分位数
+DEFAULT_UNIFORM_PERCENTILE = 90
+
+# 允许处理的图片像素数上限。输入都是用户自己选择的本地文件，Pillow 默认的解压炸弹
+# 保护在约 1.8 亿像素时就会拒绝打开，200MP 的扫描图和海报无法处理；这里关闭该保护，
+# 改为按本上限报告明确的错误（5 亿像素的RGB图解码后约 1.5 GB）
+IMAGE_MAX_PIXELS = 500_000_000
+Image.MAX_IMAGE_PIXELS = None
+
+# 按帧逐个裁剪的多帧图片格式
+MULTI_FRAME_FORMATS = ('TIFF', 'GIF')
+# 多帧TIFF输出时沿用的压缩方式，其他压缩方式（如 JPEG）改为不压缩
+TIFF_KEEP_COMPRESSIONS = ('raw', 'packbits', 'tiff_lzw', 'tiff_adobe_deflate', 'group3', 'group4')
+
+# 当前进程中接收页级进度的回调 progress(输入路径, 已分析页数, 总页数)，
+# 以及正在分析的PDF的进度 [输入路径, 已分析页数, 总页数]
+_progress_callback = None
+_page_progress = None
+
+
+def set_progress_callback(callback):
+    global _progress_callback
+    _progress_callback = callback
+
+
+def _init_progress_worker(progress_queue):
+    """工作进程初始化：页级进度通过队列发回调度进程"""
+    set_progress_callback(lambda *event: progress_queue.put(event))
+
+
+def _init_page_worker():
+    """页段工作进程初始化：fork 出的进程会继承调度进程的进度回调，
+    必须清除，页级进度只由调度进程在页段完成时报告"""
+    global _page_progress
+    set_progress_callback(None)
+    _page_progress = None
+
+
+def _forward_progress(progress_queue, on_progress):
+    for event in iter(progress_queue.get, None):
+        on_progress(*event)
+
+
+@contextmanager
+def track_page_progress(input_path, page_count):
+    """在分析一个PDF期间记录页级进度"""
+    global _page_progress
+    _page_progress = [input_path, 0, page_count]
+    report_pages(0)
+    try:
+        yield
+    finally:
+        _page_progress = None
+
+
+def report_pages(count):
+    """当前PDF又有 count 页得到内容区域，通知进度回调"""
+    if _progress_callback is None or _page_progress is None:
+        return
+    _page_progress[1] += count
+    _progress_callback(*_page_progress)
+
+
+def crop_file(file_path, output_path, settings):
+    """根据文件类型选择处理方法，返回统计信息字典。
+
+    PDF的统计包含 save_seconds / output_size 和每页的裁剪框 crop_boxes（pt）；
+    图片包含裁剪框 crop_box（像素，没有检测到内容时为 None），多帧图片为每帧的
+    crop_boxes；启用分阶段跟踪时另含 trace 记录列表。
+    """
+    if settings.get('stage_trace'):
+        with StageTracer(file_path) as tracer:
+            stats = _crop_file(file_path, output_path, settings)
+        return dict(stats or {}, trace=tracer.records)
+    return _crop_file(file_path, output_path, settings)
+
+
+def _crop_file(file_path, output_path, settings):
+    _, ext = os.path.splitext(file_path.lower())
+    if ext == '.pdf':
+        return crop_pdf(file_path, output_path, settings)
+    elif ext in SUPPORTED_IMG_FORMATS:
+        return crop_image(file_path, output_path, settings['margins'], settings)
+
+
+class OutputNameIndex:
+    """输出目录中已占用文件名的内存索引。
+
+    第一次分配时列出一次目录，之后只在内存中查找；每个原始文件名记录下一个
+    待尝试的后缀序号，同名文件很多时也不必从头逐个试探。分配在锁内进行，
+    多个线程同时分配也不会得到相同的路径。一个批次使用一个索引。
+    """
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self._names = None
+        self._next_suffix = {}
+        self._lock = threading.Lock()
+
+    def _load_names(self):
+        try:
+            with os.scandir(self.output_dir) as it:
+                return {os.path.normcase(entry.name) for entry in it}
+        except OSError:
+            # 目录不存在或无法读取时按空目录处理，写出时再报告错误
+            return set()
+
+    def allocate(self, base_name, ext):
+        """返回 base_name_cropped{ext}，已被占用时依次尝试 _cropped_2、_cropped_3 ..."""
+        counter_key = os.path.normcase(base_name + ext)
+        with self._lock:
+            if self._names is None:
+                self._names = self._load_names()
+            suffix = self._next_suffix.get(counter_key, 1)
+            while True:
+                name = f"{base_name}_cropped{ext}" if suffix == 1 else f"{base_name}_cropped_{suffix}{ext}"
+                if os.path.normcase(name) not in self._names:
+                    break
+                suffix += 1
+            self._names.add(os.path.normcase(name))
+            self._next_suffix[counter_key] = suffix + 1
+        return os.path.join(self.output_dir, name)
+
+
+def build_output_path(file_path, settings, name_index):
+    """确定输出路径；输出到目录时通过 name_index（OutputNameIndex）追加后缀，
+    避免与已有文件或本批次其他输出重名"""
+    if settings['overwrite_original']:
+        return file_path
+
+    base_name, ext = os.path.splitext(os.path.basename(file_path))
+    return name_index.allocate(base_name, ext)
+
+
+def resolve_worker_count(requested, job_count=None):
+    """确定工作进程数：未设置或为0时使用CPU核数，且不超过任务数（任务数未知时不限制）"""
+    worker_count = requested or os.cpu_count() or 1
+    if job_count is not None:
+        worker_count = min(worker_count, job_count)
+    return max(1, worker_count)
+
+
+def _crop_file_isolated(file_path, output_path, settings, pool_options):
+    """在一个单独的工作进程中处理一个文件，返回 (异常或None, 统计信息或None)"""
+    with ProcessPoolExecutor(max_workers=1, **pool_options) as executor:
+        future = executor.submit(crop_file, file_path, output_path, settings)
+        error = future.exception()
+    return error, future.result() if error is None else None
+
+
+def run_crop_jobs(jobs, settings, worker_count, on_progress=None):
+    """执行一批裁剪任务，每完成一个就产出 (输入路径, 输出路径, 异常或None, 统计信息或None)。
+
+    jobs 为 (输入路径, 输出路径) 的可迭代对象，输出路径需由调用方预先分配好；
+    可以是边发现边产出的生成器，任务按需取用，不会一次全部读入。
+    worker_count 大于1时在工作进程中并行处理，产出顺序为完成顺序。工作进程异常退出
+    （例如 MuPDF 在损坏的文件上崩溃）时，当时正在处理的文件逐个放到单独的工作进程中
+    重新处理，只有再次崩溃的文件报告为失败；其余任务换一个新的进程池继续处理。
+    on_progress(输入路径, 已分析页数, 总页数) 报告PDF的页级进度，并行时在
+    单独的转发线程中调用；某个文件的进度可能晚于它的完成结果到达。
+    """
+    if worker_count <= 1:
+        set_progress_callback(on_progress)
+        try:
+            for file_path, output_path in jobs:
+                try:
+                    stats = crop_file(file_path, output_path, settings)
+                except Exception as e:
+                    yield file_path, output_path, e, None
+                else:
+                    yield file_path, output_path, None, stats
+        finally:
+            set_progress_callback(None)
+        return
+
+    # 每个文件已经独占一个工作进程，不再在进程内按页段并行
+    worker_settings = dict(settings, worker_count=1)
+    pool_options = {}
+    forwarder = None
+    if on_progress is not None:
+        progress_queue = multiprocessing.Queue()
+        pool_options = {'initializer': _init_progress_worker, 'initargs': (progress_queue,)}
+        forwarder = threading.Thread(target=_forward_progress, args=(progress_queue, on_progress), daemon=True)
+        forwarder.start()
+
+    jobs = iter(jobs)
+    futures = {}
+    executor = ProcessPoolExecutor(max_workers=worker_count, **pool_options)
+    try:
+        while True:
+            broken = False
+            # 同时提交的任务数保持为工作进程数的两倍，完成一个再从 jobs 中取一个
+            for job in itertools.islice(jobs, worker_count * 2 - len(futures)):
+                try:
+                    future = executor.submit(crop_file, *job, worker_settings)
+                except BrokenProcessPool:
+                    # 进程池已损坏，这个任务还没有开始，放回 jobs 等新的进程池处理
+                    jobs = itertools.chain([job], jobs)
+                    broken = True
+                    break
+                futures[future] = job
+            if not futures and not broken:
+                break
+
+            done, _ = wait(futures, return_when=ALL_COMPLETED if broken else FIRST_COMPLETED)
+            if not broken and any(isinstance(future.exception(), BrokenProcessPool) for future in done):
+                # 进程池损坏后其余未完成的任务也会立即结束，一并取回
+                broken = True
+                done, _ = wait(futures)
+            interrupted = []
+            for future in done:
+                file_path, output_path = futures.pop(future)
+                error = future.exception()
+                if isinstance(error, BrokenProcessPool):
+                    interrupted.append((file_path, output_path))
+                else:
+                    yield file_path, output_path, error, future.result() if error is None else None
+            if not broken:
+                continue
+
+            executor.shutdown(wait=False)
+            # 无法判断是哪个文件导致崩溃，逐个单独重新处理
+            for file_path, output_path in interrupted:
+                yield (file_path, output_path) + _crop_file_isolated(file_path, output_path, worker_settings, pool_options)
+            executor = ProcessPoolExecutor(max_workers=worker_count, **pool_options)
+    finally:
+        executor.shutdown()
+        if forwarder is not None:
+            progress_queue.put(None)
+            forwarder.join()
+
+
+def summarize_save_stats(profile, file_stats):
+    """汇总一批文件中PDF的保存统计，没有PDF时返回空字符串"""
+    save_stats = [stats for stats in file_stats if 'output_size' in stats]
+    if not save_stats:
+        return ""
+    save_seconds = sum(stats['save_seconds'] for stats in save_stats)
+    output_size = sum(stats['output_size'] for stats in save_stats)
+    if output_size >= 1 << 20:
+        size_text = f"{output_size / (1 << 20):.2f} MB"
+    else:
+        size_text = f"{output_size / 1024:.1f} KB"
+    return f"PDF保存({profile}): {len(save_stats)} 个文件, 用时 {save_seconds:.2f}s, 共 {size_text}"
+
+
+def image_cache_params():
+    """图片检测参数，作为缓存键的一部分（超大图片的粗定位改为块内取最小值后，旧结果作废）"""
+    return f"image:{IMAGE_THRESHOLD}:{IMAGE_MIN_CONTENT_SIZE}:banded"
+
+
+def lookup_image_bounds(input_path, img, settings):
+    """检测图片内容边界；启用边界缓存时优先复用缓存结果"""
+    cache = BboxCache.from_settings(settings) if settings else None
+    if cache is None:
+        return detect_image_bounds(img)
+
+    try:
+        key = make_key(cache.file_digest(input_path), 0, image_cache_params())
+        hits = cache.get_many([key])
+        if key in hits:
+            return hits[key]
+
+        bounds = detect_image_bounds(img)
+        cache.put_many({key: list(bounds) if bounds is not None else None})
+        return bounds
+    finally:
+        cache.close()
+
+
+def lookup_frame_bounds(input_path, img, settings):
+    """逐帧检测多帧图片的内容边界，返回各帧边界列表（无内容为 None）。
+
+    每次只解码当前帧；启用边界缓存时只检测未命中的帧。
+    """
+    cache = BboxCache.from_settings(settings) if settings else None
+    try:
+        keys = []
+        hits = {}
+        if cache is not None:
+            digest = cache.file_digest(input_path)
+            keys = [make_key(digest, index, image_cache_params()) for index in range(img.n_frames)]
+            hits = cache.get_many(keys)
+
+        frame_bounds = []
+        new_items = {}
+        for index in range(img.n_frames):
+            if keys and keys[index] in hits:
+                frame_bounds.append(hits[keys[index]])
+                continue
+
+            img.seek(index)
+            with stage('detect', index):
+                # 不传文件路径：按路径重新打开只能得到第一帧
+                bounds = detect_image_bounds(img)
+            frame_bounds.append(bounds)
+            if keys:
+                new_items[keys[index]] = list(bounds) if bounds is not None else None
+
+        if cache is not None:
+            cache.put_many(new_items)
+        return frame_bounds
+    finally:
+        if cache is not None:
+            cache.close()
+
+
+def compute_image_crop_box(bounds, width, height, margins):
+    """根据内容边界和留白计算图片裁剪区域 (x1, y1, x2, y2)"""
+    min_x, min_y, max_x, max_y = bounds
+
+    # 获取边距设置
+    left_margin = margins['left']
+    top_margin = margins['top']
+    right_margin = margins['right']
+    bottom_margin = margins['bottom']
+
+    # 计算裁剪区域（添加边距）
+    x1 = max(min_x - left_margin, 0)
+    y1 = max(min_y - top_margin, 0)
+    x2 = min(max_x + right_margin, width)
+    y2 = min(max_y + bottom_margin, height)
+
+    # 内容区域有效性验证
+    # 防止裁剪过多 - 如果内容区域太小，可能是错误检测
+    if (x2 - x1) < width * 0.1 or (y2 - y1) < height * 0.1:
+        x1, y1, x2, y2 = 0, 0, width, height
+
+    # 防止裁剪过少 - 如果内容区域几乎和页面一样大，微调一下裁剪区域
+    if (x2 - x1) > width * 0.98 or (y2 - y1) > height * 0.98:
+        margin_x = width * 0.02
+        margin_y = height * 0.02
+        x1, y1 = margin_x, margin_y
+        x2, y2 = width - margin_x, height - margin_y
+
+    return x1, y1, x2, y2
+
+
+def pixel_box(box):
+    """裁剪框取整为实际裁剪的像素坐标（与 Image.crop 的取整方式一致）"""
+    return [int(round(value)) for value in box]
+
+
+def union_bounds(frame_bounds):
+    """各帧内容边界的并集，所有帧都没有内容时返回 None"""
+    present = [bounds for bounds in frame_bounds if bounds is not None]
+    if not present:
+        return None
+    return (
+        min(bounds[0] for bounds in present),
+        min(bounds[1] for bounds in present),
+        max(bounds[2] for bounds in present),
+        max(bounds[3] for bounds in present),
+    )
+
+
+def crop_image(input_path, output_path, margins, settings=None):
+    """剪裁图片白边，返回 {'crop_box': 裁剪框或None}（多帧图片为 {'crop_boxes': 每帧的裁剪框}）"""
+    # 打开图片
+    with stage('open'):
+        img = Image.open(input_path)
+        if img.width * img.height > IMAGE_MAX_PIXELS:
+            size = f"{img.width}×{img.height}"
+            img.close()
+            raise ValueError(f"图片过大（{size}），超过 {IMAGE_MAX_PIXELS // 1_000_000} 百万像素的上限")
+
+        # 多帧TIFF和GIF按帧逐个处理
+        multi_frame = img.format in MULTI_FRAME_FORMATS and getattr(img, 'n_frames', 1) > 1
+
+    if multi_frame:
+        return crop_image_frames(img, input_path, output_path, margins, settings)
+
+    # 找到内容区域边界（含噪点过滤）；检测时逐行带转换为RGB，不整图转换
+    with stage('detect'):
+        bounds = lookup_image_bounds(input_path, img, settings)
+    if bounds is not None:
+        width, height = img.size
+        x1, y1, x2, y2 = compute_image_crop_box(bounds, width, height, margins)
+
+        # 裁剪图片，输出统一为RGB模式
+        with stage('crop'):
+            cropped_img = crop_rgb(img, (x1, y1, x2, y2))
+
+        # 保存裁剪后的图片
+        if input_path == output_path:
+            # 如果覆盖原文件，先保存为临时文件再替换
+            temp_path = output_path + ".temp"
+            # 获取原文件的扩展名
+            _, ext = os.path.splitext(input_path)
+            # 确保临时文件保留原始扩展名
+            with stage('save'):
+                cropped_img.save(temp_path, format=get_image_format(ext))
+            cropped_img.close()
+            img.close()
+            with stage('replace'):
+                os.replace(temp_path, output_path)
+        else:
+            # 直接保存到新位置
+            _, ext = os.path.splitext(output_path)
+            with stage('save'):
+                cropped_img.save(output_path, format=get_image_format(ext))
+            cropped_img.close()
+            img.close()
+        return {'crop_box': pixel_box((x1, y1, x2, y2))}
+
+    # 如果没有检测到内容或检测失败，保存原图
+    if input_path != output_path:
+        _, ext = os.path.splitext(output_path)
+        with stage('save'):
+            crop_rgb(img, (0, 0) + img.size).save(output_path, format=get_image_format(ext))
+    img.close()
+    return {'crop_box': None}
+
+
+def crop_image_frames(img, input_path, output_path, margins, settings=None):
+    """逐帧裁剪多帧TIFF或GIF，并写出全部帧。
+
+    先逐帧检测内容边界，再逐帧裁剪写出，任何时候只解码一帧。
+    image_frame_crop 为 union（默认）时所有帧使用各帧边界的并集；
+    为 per_frame 时TIFF每帧按自己的边界裁剪（GIF各帧必须同样大小，始终使用并集）。
+    返回 {'crop_boxes': 每帧的裁剪框}，保留原样的帧为 None。
+    """
+    frame_count = img.n_frames
+    per_frame = (settings or {}).get('image_frame_crop') == 'per_frame' and img.format == 'TIFF'
+
+    frame_bounds = lookup_frame_bounds(input_path, img, settings)
+    shared_bounds = None if per_frame else union_bounds(frame_bounds)
+    crop_boxes = [None] * frame_count
+
+    def cropped_frames():
+        for index in range(frame_count):
+            img.seek(index)
+            bounds = frame_bounds[index] if per_frame else shared_bounds
+            with stage('crop', index):
+                if bounds is None:
+                    # 没有检测到内容，保留原帧
+                    frame = img.copy()
+                else:
+                    width, height = img.size
+                    crop_box = compute_image_crop_box(bounds, width, height, margins)
+                    crop_boxes[index] = pixel_box(crop_box)
+                    frame = img.crop(crop_box)
+            yield frame
+
+    if input_path == output_path and shared_bounds is None and not per_frame:
+        # 所有帧都没有内容，覆盖模式下不需要重写
+        img.close()
+        return {'crop_boxes': crop_boxes}
+
+    save_path = output_path + ".temp" if input_path == output_path else output_path
+    try:
+        if img.format == 'TIFF':
+            compression = img.info.get('compression', 'raw')
+            if compression not in TIFF_KEEP_COMPRESSIONS:
+                compression = 'raw'
+            # 逐帧追加写入，写完一帧即可释放
+            with TiffImagePlugin.AppendingTiffWriter(save_path, True) as writer:
+                for index, frame in enumerate(cropped_frames()):
+                    with stage('save', index):
+                        frame.save(writer, format='TIFF', compression=compression)
+                        writer.newFrame()
+                    frame.close()
+        else:
+            # GIF 编码器需要比较相邻帧，由它按需从生成器中取帧；
+            # 裁剪后的帧保留各自的 duration 信息
+            img.seek(0)
+            options = {}
+            if 'loop' in img.info:
+                options['loop'] = img.info['loop']
+            frames = cropped_frames()
+            first_frame = next(frames)
+            with stage('save'):
+                first_frame.save(save_path, format='GIF', save_all=True, append_images=frames, **options)
+    except Exception:
+        if save_path != output_path and os.path.exists(save_path):
+            os.remove(save_path)
+        raise
+    finally:
+        img.close()
+
+    if save_path != output_path:
+        with stage('replace'):
+            os.replace(save_path, output_path)
+    return {'crop_boxes': crop_boxes}
+
+
+def get_image_format(ext):
+    """根据文件扩展名获取图片格式"""
+    ext = ext.lower().strip('.')
+    # 处理特殊情况
+    if ext == 'jpg':
+        return 'JPEG'
+    elif ext == 'tif':
+        return 'TIFF'
+    elif ext in ('jpeg', 'png', 'bmp', 'tiff', 'gif'):
+        return ext.upper()
+    # 默认返回PNG格式
+    return 'PNG'
+
+
+def save_page_debug(debug_writer, page, page_num, detect_mode, page_zoom, content_rect):
+    """渲染一张缩小的预览图，连同检测参数和结果交给后台写出"""
+    rect = page.rect
+    zoom = PREVIEW_MAX_SIDE / max(rect.width, rect.height, 1)
+    np_img, pix = render_page_array(page, zoom)
+    # 图像直接引用 pixmap 的内存，交给后台线程前复制一份
+    np_img = np_img.copy()
+
+    box = None
+    record = {
+        'file': os.path.basename(page.parent.name),
+        'page': page_num + 1,
+        'detect_mode': detect_mode,
+        'threshold': PDF_THRESHOLD,
+        'coarse_threshold': COARSE_THRESHOLD,
+        'detect_zoom': round(page_zoom, 4),
+        'page_rect': [round(value, 3) for value in rect],
+        'content_rect': None,
+        'content_pixels': None,
+        'preview_zoom': round(zoom, 4),
+        'preview_size': [pix.width, pix.height],
+    }
+    if content_rect is not None:
+        record['content_rect'] = [round(value, 3) for value in content_rect]
+        record['content_pixels'] = [round(value * page_zoom) for value in content_rect]
+        box = tuple(value * zoom for value in content_rect)
+
+    stem, _ = os.path.splitext(record['file'])
+    debug_writer.submit(f"{stem}_page_{page_num+1}", np_img, PDF_THRESHOLD, box, record)
+
+
+def render_band_bytes(settings):
+    """检测渲染时单个行带的内存上限（字节），0 或未设置时使用默认值"""
+    band_mb = settings.get('render_band_mb')
+    return int(band_mb * (1 << 20)) if band_mb else RENDER_BAND_BYTES
+
+
+def detect_pixel_budget(settings):
+    """精确检测时整页渲染的像素数上限，0 或未设置时使用默认值"""
+    megapixels = settings.get('detect_max_megapixels')
+    return int(megapixels * 1_000_000) if megapixels else DETECT_PIXEL_BUDGET
+
+
+def is_uniform_page_crop(settings):
+    return settings.get('pdf_page_crop', 'per_page') in ('union', 'percentile')
+
+
+def uniform_content_rect(content_rects, mode='union', percentile=DEFAULT_UNIFORM_PERCENTILE):
+    """把各页内容区域合并为一个统一的内容区域，没有任何内容时返回 None。
+
+    union 取所有页面的并集；percentile 每条边各取所有页面在该分位上的位置（向外取），
+    个别内容特别大的页面（如标题页）不会撑大其他页面的裁剪区域。
+    失败（None）和空白（空矩形）的页面不参与合并。
+    """
+    boxes = np.array([box for box in content_rects if box is not None and not fitz.Rect(box).is_empty])
+    if not len(boxes):
+        return None
+    if mode == 'percentile' and percentile < 100:
+        return fitz.Rect(
+            np.percentile(boxes[:, 0], 100 - percentile, method='lower'),
+            np.percentile(boxes[:, 1], 100 - percentile, method='lower'),
+            np.percentile(boxes[:, 2], percentile, method='higher'),
+            np.percentile(boxes[:, 3], percentile, method='higher'),
+        )
+    return fitz.Rect(boxes[:, 0].min(), boxes[:, 1].min(), boxes[:, 2].max(), boxes[:, 3].max())
+
+
+def detect_page_content(doc, page_num, settings, debug_writer=None):
+    """分析单页内容区域（页面坐标），没有内容时返回整页，分析出错时返回 None"""
+    page = doc.load_page(page_num)
+    rect = page.rect
+    detect_mode = settings.get('pdf_detect_mode', 'raster')
+    profile = settings.get('detect_render_profile') or DEFAULT_RENDER_PROFILE
+    band_bytes = render_band_bytes(settings)
+    uniform = is_uniform_page_crop(settings)
+
+    # 使用pixmap分析页面内容
+    try:
+        if uniform:
+            # 统一裁剪只需要一遍低分辨率检测，不做高分辨率精修
+            zoom = UNIFORM_ZOOM
+            content_rect = analyze_page_lowres(page, detect_mode, zoom, band_bytes, profile)
+        else:
+            # 矢量模式直接使用显示列表几何范围；栅格模式先低分辨率粗定位，
+            # 再只对四条边附近做高分辨率渲染。渲染倍率按页面尺寸、目标精度和像素预算逐页确定
+            zoom = detect_zoom(rect, settings.get('detect_precision_pt'), detect_pixel_budget(settings))
+            content_rect = analyze_page(page, detect_mode, zoom, band_bytes=band_bytes, profile=profile)
+        if debug_writer is not None:
+            with stage('debug'):
+                save_page_debug(debug_writer, page, page_num, detect_mode, zoom, content_rect)
+        if content_rect is None:
+            # 未发现内容：统一裁剪时记为空矩形，合并时跳过；否则使用整个页面
+            content_rect = fitz.Rect() if uniform else rect
+    except Exception as e:
+        print(f"像素分析出错: {str(e)}")
+        return None  # 出错时由调用方使用整个页面，且不写入缓存
+    return content_rect
+
+
+def analyze_doc_pages(doc, page_nums, settings, debug_dir=None):
+    """分析已打开文档中的指定页面，返回各页内容区域元组，无法分析的页面为 None。
+
+    指定 debug_dir 时每页的调试输出由后台线程写入该目录，返回前等待全部写完。
+    """
+    content_rects = []
+    with DebugWriter(debug_dir) if debug_dir else nullcontext() as debug_writer:
+        for page_num in page_nums:
+            try:
+                with stage('detect', page_num):
+                    content_rect = detect_page_content(doc, page_num, settings, debug_writer)
+                content_rects.append(tuple(content_rect) if content_rect is not None else None)
+            except Exception as e:
+                print(f"分析第 {page_num+1} 页时出错: {str(e)}")
+                content_rects.append(None)
+            report_pages(1)
+    return content_rects
+
+
+def analyze_pdf_pages(input_path, page_nums, settings, debug_dir=None, trace=False):
+    """在工作进程中独立打开文档并分析一组页面，返回 (各页内容区域, 分阶段跟踪记录)"""
+    if trace:
+        with StageTracer(input_path) as tracer:
+            content_rects, _ = analyze_pdf_pages(input_path, page_nums, settings, debug_dir)
+        return content_rects, tracer.records
+
+    doc = fitz.open(input_path)
+    try:
+        return analyze_doc_pages(doc, page_nums, settings, debug_dir), []
+    finally:
+        doc.close()
+
+
+def split_page_chunks(page_nums, worker_count):
+    """把页面切分成连续的页段，页段数为工作进程数的数倍以便均衡负载"""
+    chunk_size = max(PAGE_CHUNK_MIN_SIZE, -(-len(page_nums) // (worker_count * 4)))
+    return [page_nums[start:start + chunk_size] for start in range(0, len(page_nums), chunk_size)]
+
+
+def analyze_pages(doc, input_path, page_nums, settings, debug_dir=None):
+    """分析指定页面，按传入顺序返回内容区域。
+
+    页数较多且允许多个工作进程时，按页段分发到工作进程并行分析，
+    每个工作进程独立打开文档；某个页段失败时在当前进程中重新分析。
+    """
+    worker_count = resolve_worker_count(settings.get('worker_count'), -(-len(page_nums) // PAGE_CHUNK_MIN_SIZE))
+    if len(page_nums) < PAGE_PARALLEL_MIN_PAGES or worker_count <= 1:
+        return analyze_doc_pages(doc, page_nums, settings, debug_dir)
+
+    chunks = split_page_chunks(page_nums, worker_count)
+    content_rects = []
+    with ProcessPoolExecutor(max_workers=worker_count, initializer=_init_page_worker) as executor:
+        futures = [
+            executor.submit(analyze_pdf_pages, input_path, chunk, settings, debug_dir, settings.get('stage_trace'))
+            for chunk in chunks
+        ]
+        # 按页序合并各页段的结果
+        for chunk, future in zip(chunks, futures):
+            try:
+                chunk_rects, trace_records = future.result()
+                content_rects.extend(chunk_rects)
+                report_pages(len(chunk_rects))
+                add_records(trace_records)
+            except Exception as e:
+                print(f"并行分析第 {chunk[0]+1}-{chunk[-1]+1} 页失败，改为顺序分析: {str(e)}")
+                content_rects.extend(analyze_doc_pages(doc, chunk, settings, debug_dir))
+    return content_rects
+
+
+def pdf_cache_params(settings):
+    """PDF检测参数，作为缓存键的一部分"""
+    profile = settings.get('detect_render_profile') or DEFAULT_RENDER_PROFILE
+    mode = settings.get('pdf_detect_mode', 'raster')
+    if mode == 'vector':
+        mode = f"vector{VECTOR_DETECT_VERSION}"
+    if is_uniform_page_crop(settings):
+        # union 与 percentile 使用同一遍低分辨率检测的结果
+        return f"pdf-lowres:{mode}:{UNIFORM_ZOOM}:{profile}:{COARSE_THRESHOLD}"
+
+    precision = settings.get('detect_precision_pt') or f"{DETECT_ZOOM}x"
+    return (
+        f"pdf:{mode}:{precision}:{detect_pixel_budget(settings)}:"
+        f"{profile}:{PDF_THRESHOLD}:{COARSE_SCALE}"
+    )
+
+
+def compute_content_rects(doc, input_path, settings, debug_dir=None):
+    """计算文档每一页的内容区域（元组），按页序返回。
+
+    启用边界缓存时先查询缓存，只分析未命中的页面，并把新结果写回缓存。
+    """
+    page_count = len(doc)
+    cache = BboxCache.from_settings(settings)
+    if cache is None:
+        return analyze_pages(doc, input_path, list(range(page_count)), settings, debug_dir)
+
+    try:
+        digest = cache.file_digest(input_path)
+        params = pdf_cache_params(settings)
+        keys = [make_key(digest, page_num, params) for page_num in range(page_count)]
+        hits = cache.get_many(keys)
+        report_pages(len(hits))
+
+        content_rects = [hits.get(key) for key in keys]
+        missing = [page_num for page_num, key in enumerate(keys) if key not in hits]
+        if missing:
+            new_rects = analyze_pages(doc, input_path, missing, settings, debug_dir)
+            for page_num, content_rect in zip(missing, new_rects):
+                content_rects[page_num] = content_rect
+            cache.put_many({
+                keys[page_num]: list(content_rect)
+                for page_num, content_rect in zip(missing, new_rects)
+                if content_rect is not None
+            })
+        return content_rects
+    finally:
+        cache.close()
+
+
+def set_page_crop_box(doc, page, crop_box):
+    """把裁剪框（页面可见坐标）写入页面的 MediaBox 和 CropBox，不复制内容流。
+
+    裁剪框先去掉页面旋转，再按当前 CropBox 在 PDF 坐标系中的位置换算，
+    旋转页面和 MediaBox 不从原点开始的页面都能正确处理。
+    """
+    box = crop_box * page.derotation_matrix
+    box.normalize()
+
+    # page.cropbox 为 y 轴向下、相对 MediaBox 上边缘的坐标，换算回 PDF 坐标
+    origin_x = page.cropbox.x0
+    top_y = page.mediabox.y1 - page.cropbox.y0
+    pdf_box = (origin_x + box.x0, top_y - box.y1, origin_x + box.x1, top_y - box.y0)
+    box_value = "[" + " ".join(f"{round(value, 3):g}" for value in pdf_box) + "]"
+    doc.xref_set_key(page.xref, "MediaBox", box_value)
+    doc.xref_set_key(page.xref, "CropBox", box_value)
+
+
+def crop_pdf(input_path, output_path, settings):
+    """剪裁PDF文件白边"""
+    # 打开PDF文件
+    with stage('open'):
+        doc = fitz.open(input_path)
+
+    # 输出方式：rebuild 新建文档嵌入裁剪后的页面，cropbox 直接修改原页面的页面框
+    cropbox_mode = settings.get('pdf_output_mode', 'rebuild') == 'cropbox'
+
+    # 创建新文档用于保存
+    new_doc = doc if cropbox_mode else fitz.open()
+
+    # 获取边距设置
+    margins = settings['margins']
+    left_margin = margins['left']
+    top_margin = margins['top']
+    right_margin = margins['right']
+    bottom_margin = margins['bottom']
+
+    # 创建调试输出目录
+    debug_dir = None
+    if settings.get('save_debug_images'):
+        debug_dir = os.path.join(os.path.dirname(output_path), "debug_output")
+        os.makedirs(debug_dir, exist_ok=True)
+
+    # 先分析所有页面的内容区域（大文档按页段并行），再按页序统一输出
+    with track_page_progress(input_path, len(doc)):
+        content_rects = compute_content_rects(doc, input_path, settings, debug_dir)
+
+    # 统一裁剪：所有页面使用合并后的同一个内容区域
+    if is_uniform_page_crop(settings):
+        uniform_rect = uniform_content_rect(
+            content_rects,
+            settings['pdf_page_crop'],
+            settings.get('pdf_uniform_percentile') or DEFAULT_UNIFORM_PERCENTILE,
+        )
+        content_rects = [uniform_rect] * len(content_rects)
+
+    # 处理每一页，记录每页最终的裁剪框（保留原样的页面为整页）
+    crop_boxes = []
+    for page_num, content_rect in enumerate(content_rects):
+        try:
+            page = doc.load_page(page_num)
+
+            # 获取页面的边界框
+            rect = page.rect
+            content_rect = fitz.Rect(content_rect) if content_rect is not None else rect
+
+            # 内容区域有效性验证
+            # 防止裁剪过多 - 如果内容区域太小，可能是错误检测
+            # if content_rect.width < rect.width * 0.1 or content_rect.height < rect.height * 0.1:
+            #     print(f"检测到的内容区域过小，使用整个页面: {content_rect}")
+            #     content_rect = rect
+
+            # 防止裁剪过少 - 如果内容区域几乎和页面一样大，微调一下裁剪区域
+            # if content_rect.width > rect.width * 0.98 or content_rect.height > rect.height * 0.98:
+            #     margin_x = rect.width * 0.02
+            #     margin_y = rect.height * 0.02
+            #     content_rect = fitz.Rect(margin_x, margin_y, rect.width - margin_x, rect.height - margin_y)
+
+            # 应用边距
+            crop_box = fitz.Rect(
+                max(content_rect.x0 - left_margin, 0),
+                max(content_rect.y0 - top_margin, 0),
+                min(content_rect.x1 + right_margin, rect.width),
+                min(content_rect.y1 + bottom_margin, rect.height)
+            )
+
+            # 确保裁剪框不超出页面边界
+            crop_box = crop_box & rect
+
+            if cropbox_mode:
+                # 只改写页面框，内容流保持不动
+                if not crop_box.is_empty:
+                    with stage('set_cropbox', page_num):
+                        set_page_crop_box(doc, page, crop_box)
+                crop_boxes.append(crop_box if not crop_box.is_empty else rect)
+                continue
+
+            # 创建新页面并插入裁剪后的内容
+            with stage('show_pdf_page', page_num):
+                new_page = new_doc.new_page(width=crop_box.width, height=crop_box.height)
+                new_page.show_pdf_page(new_page.rect, doc, page_num, clip=crop_box)
+            crop_boxes.append(crop_box)
+
+        except Exception as e:
+            # 如果处理当前页面出错，保留原始页面
+            print(f"处理第 {page_num+1} 页时出错: {str(e)}")
+            page = doc.load_page(page_num)
+            crop_boxes.append(page.rect)
+            if cropbox_mode:
+                continue
+            new_page = new_doc.new_page(width=page.rect.width, height=page.rect.height)
+            new_page.show_pdf_page(new_page.rect, doc, page_num)
+
+    # 按保存方案写出；如果是覆盖原文件，先保存为临时文件，然后替换
+    profile = settings.get('pdf_save_profile') or DEFAULT_PDF_SAVE_PROFILE
+    save_path = output_path + ".temp" if input_path == output_path else output_path
+    save_started = time.perf_counter()
+    with stage('save'):
+        new_doc.save(save_path, **PDF_SAVE_PROFILES.get(profile, PDF_SAVE_PROFILES[DEFAULT_PDF_SAVE_PROFILE]))
+    save_seconds = time.perf_counter() - save_started
+    if new_doc is not doc:
+        new_doc.close()
+    doc.close()
+    if save_path != output_path:
+        with stage('replace'):
+            os.replace(save_path, output_path)
+
+    return {
+        'save_seconds': save_seconds,
+        'output_size': os.path.getsize(output_path),
+        'crop_boxes': [[round(value, 3) for value in box] for box in crop_boxes],
+    }
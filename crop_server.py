@@ -0,0 +1,418 @@
+"""常驻裁剪服务：在本机端口或 Unix 套接字上接收裁剪任务，用常驻的工作进程池处理。
+
+启动时就创建好工作进程并导入 PyMuPDF / numpy，之后每个任务只需付出裁剪本身的
+时间。客户端见 crop_client.py。
+
+协议：每个请求和响应都是一行 UTF-8 JSON，一个连接上可以依次发送多个请求。每个请求
+都必须带有 "token"，即服务启动时写入配置目录 crop_server_token 文件的随机令牌。
+    {"command": "crop", "files": [...], "settings": {...}}
+        files 中的每项为输入路径（文件、通配符或目录），或 {"input": ..., "output": ...}
+        直接指定输出文件，输出文件的扩展名必须与输入文件的格式一致，已存在的输出文件
+        也必须是同一格式；settings 只接受 CLIENT_SETTINGS 中的项，未给出的项使用
+        cli.py 的默认值。路径必须是绝对路径。响应为
+        {"ok": 全部成功, "succeeded": n, "failed": n, "elapsed": 秒, "results": [...]}，
+        results 按输入顺序给出每个文件的 input / output / ok / error 和 crop_file 的统计信息
+        （含裁剪框）。
+    {"command": "ping"}     返回服务进程号和工作进程数
+    {"command": "shutdown"} 停止服务
+请求本身无效时响应为 {"ok": false, "error": 原因}。某一行不是 JSON、令牌不正确，或者
+收到的是 HTTP 请求（例如网页脚本向本机端口发送的请求）时，服务直接关闭连接，不再
+处理这个连接上之后的内容。
+
+只监听本机地址；服务会按请求读写本机用户可以访问的路径，不要把端口转发到其他机器，
+也不要把令牌文件泄露给其他用户。
+
+示例:
+    python crop_server.py -j 4
+    python crop_server.py --socket /tmp/figure_cropper.sock
+"""
+import argparse
+import hmac
+import json
+import multiprocessing
+import os
+import re
+import secrets
+import socket
+import socketserver
+import stat
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import crop_engine
+from bbox_cache import CACHE_FILENAME
+from cli import EXIT_OK, EXIT_USAGE, collect_input_files
+from config_paths import get_config_path
+from crop_client import DEFAULT_HOST, DEFAULT_PORT, TOKEN_FILENAME, read_token
+from stage_trace import TRACE_FILENAME, append_trace
+
+# 请求中允许客户端覆盖的设置项；缓存路径、调试输出、阶段跟踪等只使用服务的默认值
+CLIENT_SETTINGS = (
+    'overwrite_original',
+    'output_dir',
+    'margins',
+    'pdf_detect_mode',
+    'detect_precision_pt',
+    'detect_max_megapixels',
+    'detect_render_profile',
+    'pdf_output_mode',
+    'pdf_page_crop',
+    'pdf_uniform_percentile',
+    'pdf_save_profile',
+    'image_frame_crop',
+    'render_band_mb',
+)
+
+# HTTP 请求行，例如浏览器发来的 "POST / HTTP/1.1"
+HTTP_REQUEST_LINE = re.compile(rb'^[A-Z]+ \S+ HTTP/\d')
+
+# 各格式文件开头的特征字节，用于确认已存在的输出文件与输入文件格式相同
+FILE_SIGNATURES = {
+    'PDF': (b'%PDF-',),
+    'PNG': (b'\x89PNG\r\n\x1a\n',),
+    'JPEG': (b'\xff\xd8\xff',),
+    'GIF': (b'GIF87a', b'GIF89a'),
+    'BMP': (b'BM',),
+    'TIFF': (b'II*\x00', b'MM\x00*'),
+}
+
+
+def warm_up():
+    """在工作进程中执行一次，使进程启动并导入裁剪引擎"""
+    return os.getpid()
+
+
+def default_settings():
+    """与 cli.py 默认参数相同的处理设置"""
+    return {
+        'overwrite_original': False,
+        'output_dir': '',
+        'margins': {'left': 0, 'right': 0, 'top': 0, 'bottom': 0},
+        'save_debug_images': False,
+        'pdf_detect_mode': 'raster',
+        'detect_precision_pt': 0,
+        'detect_max_megapixels': 0,
+        'detect_render_profile': 'accurate',
+        'pdf_output_mode': 'rebuild',
+        'pdf_page_crop': 'per_page',
+        'pdf_uniform_percentile': crop_engine.DEFAULT_UNIFORM_PERCENTILE,
+        'pdf_save_profile': crop_engine.DEFAULT_PDF_SAVE_PROFILE,
+        'image_frame_crop': 'union',
+        'worker_count': 1,
+        'render_band_mb': 0,
+        'bbox_cache_path': get_config_path(CACHE_FILENAME),
+        'stage_trace': False,
+    }
+
+
+def load_or_create_token(path):
+    """读取访问令牌；不存在时生成一个随机令牌写入 path，文件仅当前用户可读写"""
+    token = read_token(path)
+    if token:
+        return token
+    token = secrets.token_hex(32)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(token)
+    return token
+
+
+def merge_settings(requested):
+    """把请求中的设置合并到默认设置上，margins 按边合并；不在 CLIENT_SETTINGS 中的项报错"""
+    if not isinstance(requested, dict):
+        raise ValueError("settings 必须是 JSON 对象")
+    unknown = sorted(set(requested) - set(CLIENT_SETTINGS))
+    if unknown:
+        raise ValueError(f"不支持的设置项: {', '.join(unknown)}")
+    settings = default_settings()
+    requested = dict(requested)
+    margins = requested.pop('margins', None) or {}
+    if not isinstance(margins, dict) or not set(margins) <= set(settings['margins']):
+        raise ValueError("margins 只能包含 left / right / top / bottom")
+    settings['margins'].update(margins)
+    settings.update(requested)
+    percentile = settings['pdf_uniform_percentile']
+    if not isinstance(percentile, (int, float)) or not 0 <= percentile <= 100:
+        raise ValueError("pdf_uniform_percentile 必须在 0～100 之间")
+    # 每个文件独占一个工作进程，进程内不再按页段并行
+    settings['worker_count'] = 1
+    return settings
+
+
+def require_absolute(path):
+    if not isinstance(path, str) or not os.path.isabs(path):
+        raise ValueError(f"路径必须是绝对路径: {path}")
+    return path
+
+
+def file_format(path):
+    """按扩展名得到文件格式（PDF 或 Pillow 的格式名），不支持的扩展名返回 None"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.pdf':
+        return 'PDF'
+    if ext in crop_engine.SUPPORTED_IMG_FORMATS:
+        return crop_engine.get_image_format(ext)
+    return None
+
+
+def check_output_file(input_path, output_path):
+    """直接指定的输出文件必须与输入文件格式相同，已存在时内容也必须是该格式；返回错误或None"""
+    input_format = file_format(input_path)
+    if file_format(output_path) != input_format:
+        return f"输出文件的扩展名必须与输入文件的格式（{input_format}）一致"
+    if not os.path.lexists(output_path):
+        return None
+    if not os.path.isfile(output_path):
+        return "输出路径已存在且不是普通文件"
+    with open(output_path, 'rb') as f:
+        head = f.read(1024)
+    signatures = FILE_SIGNATURES[input_format]
+    # PDF 头允许出现在文件开头 1024 字节内
+    if input_format == 'PDF' and signatures[0] in head:
+        return None
+    if head.startswith(signatures):
+        return None
+    return f"输出文件已存在且不是 {input_format} 文件，不会覆盖"
+
+
+def plan_jobs(files, settings):
+    """展开请求中的输入并分配输出路径，返回 [(输入, 输出, 错误或None)]。
+
+    输出到目录时每个请求使用一个 OutputNameIndex；多个请求同时输出同名文件到
+    同一目录时可能互相覆盖，这种情况应直接指定输出文件。
+    """
+    if not isinstance(files, list) or not files:
+        raise ValueError("files 必须是非空列表")
+    to_output_dir = not settings['overwrite_original']
+    if to_output_dir and settings['output_dir']:
+        require_absolute(settings['output_dir'])
+    output_names = crop_engine.OutputNameIndex(settings['output_dir'])
+    exclude_dirs = (settings['output_dir'],) if to_output_dir else ()
+
+    jobs = []
+    for item in files:
+        output_path = None
+        if isinstance(item, dict):
+            input_path = require_absolute(item.get('input'))
+            if item.get('output') is not None:
+                output_path = require_absolute(item['output'])
+            matches = [input_path] if os.path.isfile(input_path) else []
+        else:
+            input_path = require_absolute(item)
+            matches, _ = collect_input_files([input_path], exclude_dirs)
+
+        if not matches:
+            jobs.append((input_path, output_path, "未找到支持的文件"))
+        elif output_path is not None:
+            jobs.append((input_path, output_path, check_output_file(input_path, output_path)))
+        elif to_output_dir and not settings['output_dir']:
+            raise ValueError("没有设置 output_dir 或 overwrite_original，也没有直接指定输出文件")
+        else:
+            jobs.extend(
+                (file_path, crop_engine.build_output_path(file_path, settings, output_names), None)
+                for file_path in matches
+            )
+    return jobs
+
+
+class CropService:
+    """常驻的工作进程池和请求处理"""
+
+    def __init__(self, worker_count, token):
+        self.worker_count = worker_count
+        self.token = token
+        self.lock = threading.Lock()
+        self.executor = self.start_pool()
+
+    def start_pool(self):
+        executor = ProcessPoolExecutor(max_workers=self.worker_count)
+        # 预先启动全部工作进程，第一个请求不必等待进程启动和导入
+        for future in [executor.submit(warm_up) for _ in range(self.worker_count)]:
+            future.result()
+        return executor
+
+    def submit(self, *args):
+        with self.lock:
+            try:
+                return self.executor.submit(*args)
+            except BrokenProcessPool:
+                # 有工作进程异常退出（例如内存不足被系统结束）后重建进程池
+                self.executor.shutdown(wait=False)
+                self.executor = self.start_pool()
+                return self.executor.submit(*args)
+
+    def close(self):
+        with self.lock:
+            self.executor.shutdown(cancel_futures=True)
+
+    def check_token(self, request):
+        token = request.get('token') if isinstance(request, dict) else None
+        return isinstance(token, str) and hmac.compare_digest(token.encode('utf-8'), self.token.encode('utf-8'))
+
+    def handle(self, request):
+        command = request.get('command', 'crop')
+        if command == 'crop':
+            return self.crop(request.get('files'), request.get('settings') or {})
+        if command == 'ping':
+            return {'ok': True, 'pid': os.getpid(), 'workers': self.worker_count}
+        if command == 'shutdown':
+            return {'ok': True}
+        raise ValueError(f"未知的命令: {command}")
+
+    def crop(self, files, requested_settings):
+        started = time.perf_counter()
+        settings = merge_settings(requested_settings)
+        jobs = plan_jobs(files, settings)
+
+        output_dirs = {os.path.dirname(output_path) for _, output_path, error in jobs if error is None}
+        for output_dir in output_dirs:
+            os.makedirs(output_dir, exist_ok=True)
+
+        futures = [
+            self.submit(crop_engine.crop_file, file_path, output_path, settings) if error is None else None
+            for file_path, output_path, error in jobs
+        ]
+        results = []
+        trace_records = []
+        for (file_path, output_path, error), future in zip(jobs, futures):
+            stats = {}
+            if future is not None:
+                try:
+                    stats = dict(future.result() or {})
+                except Exception as e:
+                    error = str(e) or type(e).__name__
+            trace_records.extend(stats.pop('trace', []))
+            results.append(dict(input=file_path, output=output_path, ok=error is None, error=error, **stats))
+
+        if trace_records:
+            try:
+                append_trace(get_config_path(TRACE_FILENAME), trace_records)
+            except OSError as exc:
+                print(f"写入阶段跟踪失败: {exc}", file=sys.stderr)
+
+        failed = sum(1 for result in results if not result['ok'])
+        return {
+            'ok': failed == 0,
+            'succeeded': len(results) - failed,
+            'failed': failed,
+            'elapsed': round(time.perf_counter() - started, 3),
+            'results': results,
+        }
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def send(self, response):
+        self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8') + b'\n')
+        self.wfile.flush()
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            if HTTP_REQUEST_LINE.match(line):
+                # 网页脚本等发来的 HTTP 请求：不回应，直接断开，请求体不会被当作任务执行
+                return
+            try:
+                request = json.loads(line)
+            except ValueError:
+                self.send({'ok': False, 'error': "请求不是有效的 JSON，连接已关闭"})
+                return
+            if not self.server.service.check_token(request):
+                self.send({'ok': False, 'error': "访问令牌不正确，连接已关闭"})
+                return
+            try:
+                response = self.server.service.handle(request)
+            except Exception as e:
+                response = {'ok': False, 'error': str(e) or type(e).__name__}
+            self.send(response)
+            if request.get('command') == 'shutdown':
+                # shutdown 会等待 serve_forever 退出，不能在处理请求的线程中直接等待
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+                return
+
+
+class TCPCropServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+if hasattr(socketserver, 'ThreadingUnixStreamServer'):
+    class UnixCropServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+
+
+def remove_stale_socket(socket_path):
+    """删除上次服务异常退出时留下的套接字文件；仍有服务在监听时报错"""
+    try:
+        mode = os.stat(socket_path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise OSError(f"{socket_path} 已存在且不是套接字")
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except OSError:
+        os.remove(socket_path)
+    else:
+        raise OSError(f"已有服务在 {socket_path} 上运行")
+    finally:
+        probe.close()
+
+
+def create_server(port=DEFAULT_PORT, socket_path=None):
+    if not socket_path:
+        return TCPCropServer((DEFAULT_HOST, port), RequestHandler)
+    if not hasattr(socketserver, 'ThreadingUnixStreamServer'):
+        raise OSError("当前系统不支持 Unix 套接字，请改用 --port")
+    remove_stale_socket(socket_path)
+    return UnixCropServer(socket_path, RequestHandler)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="crop_server.py",
+        description="常驻裁剪服务：保持工作进程和依赖库常驻，通过本机套接字接收裁剪任务。",
+    )
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"监听的本机端口，默认 {DEFAULT_PORT}")
+    parser.add_argument("--socket", help="改为监听 Unix 套接字（仅 Linux / macOS）")
+    parser.add_argument("-j", "--workers", type=int, default=0, help="工作进程数，0 表示使用全部 CPU 核心")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        server = create_server(args.port, args.socket)
+    except OSError as exc:
+        print(f"无法启动服务: {exc}", file=sys.stderr)
+        return EXIT_USAGE
+
+    address = args.socket or f"{DEFAULT_HOST}:{args.port}"
+    try:
+        try:
+            token = load_or_create_token(get_config_path(TOKEN_FILENAME))
+        except OSError as exc:
+            print(f"无法创建访问令牌: {exc}", file=sys.stderr)
+            return EXIT_USAGE
+        server.service = CropService(crop_engine.resolve_worker_count(args.workers), token)
+        print(f"裁剪服务已启动: {address}，{server.service.worker_count} 个工作进程（按 Ctrl+C 停止）", flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        server.service.close()
+    finally:
+        server.server_close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+    print("裁剪服务已停止")
+    return EXIT_OK
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
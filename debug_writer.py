@@ -0,0 +1,89 @@
+"""调试输出：每页写出一张缩小的叠加图和一份记录阈值、边界的 JSON。
+
+叠加图在预览分辨率下把被判定为背景的像素着色，并用红框标出检测到的内容区域。
+图像合成、编码和写文件都在后台线程中进行；队列有上限，写出跟不上时处理线程
+会等待，内存占用不会无限增长。
+"""
+import json
+import os
+import queue
+import threading
+
+import numpy as np
+from PIL import Image
+
+from bbox_detect import compute_content_mask
+
+# 叠加图最长边的像素数
+PREVIEW_MAX_SIDE = 800
+# 后台写出队列最多积压的页数
+MAX_PENDING = 8
+# 背景像素的着色、内容区域边框的颜色和宽度
+BACKGROUND_TINT = (150, 200, 255)
+RECT_COLOR = (255, 0, 0)
+RECT_WIDTH = 2
+
+
+def render_overlay(np_img, threshold, box=None):
+    """生成叠加图：np_img 为预览图像，box 为预览图像素坐标下的内容区域 (left, top, right, bottom)"""
+    if np_img.ndim == 2:
+        np_img = np_img[:, :, None]
+    if np_img.shape[2] >= 3:
+        overlay = np_img[:, :, :3]
+    else:
+        overlay = np.repeat(np_img[:, :, :1], 3, axis=2)
+
+    # 背景像素与着色颜色各取一半，内容像素保持原样
+    content = compute_content_mask(np_img, threshold)
+    tinted = (overlay >> 1) + (np.array(BACKGROUND_TINT, dtype=np.uint8) >> 1)
+    overlay = np.where(content[:, :, None], overlay, tinted)
+
+    if box is not None:
+        height, width = overlay.shape[:2]
+        left, top, right, bottom = (int(round(value)) for value in box)
+        left, right = max(0, min(left, width - 1)), max(0, min(right, width - 1))
+        top, bottom = max(0, min(top, height - 1)), max(0, min(bottom, height - 1))
+        overlay[top:bottom + 1, left:left + RECT_WIDTH] = RECT_COLOR
+        overlay[top:bottom + 1, max(left, right - RECT_WIDTH + 1):right + 1] = RECT_COLOR
+        overlay[top:top + RECT_WIDTH, left:right + 1] = RECT_COLOR
+        overlay[max(top, bottom - RECT_WIDTH + 1):bottom + 1, left:right + 1] = RECT_COLOR
+    return overlay
+
+
+class DebugWriter:
+    """后台写出调试文件；用 with 包住一批页面，退出时等待全部写完"""
+
+    def __init__(self, debug_dir, max_pending=MAX_PENDING):
+        self.debug_dir = debug_dir
+        self._queue = queue.Queue(max_pending)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, name, np_img, threshold, box, record):
+        """排队写出 name_overlay.png 和 name.json；队列已满时等待"""
+        self._queue.put((name, np_img, threshold, box, record))
+
+    def _run(self):
+        for item in iter(self._queue.get, None):
+            try:
+                self._write(*item)
+            except Exception as e:
+                print(f"保存调试输出失败: {str(e)}")
+
+    def _write(self, name, np_img, threshold, box, record):
+        overlay_path = os.path.join(self.debug_dir, f"{name}_overlay.png")
+        # 调试图只求写得快，使用最低的压缩级别
+        Image.fromarray(render_overlay(np_img, threshold, box)).save(overlay_path, compress_level=1)
+        with open(os.path.join(self.debug_dir, f"{name}.json"), 'w', encoding='utf-8') as f:
+            json.dump(record, f, ensure_ascii=False, indent=2)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
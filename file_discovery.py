@@ -0,0 +1,60 @@
+"""文件发现：把拖入或命令行给出的文件和文件夹展开为待处理的文件。
+
+文件夹用 os.scandir 按需递归遍历，边遍历边产出，不需要先列出整棵目录树。
+"""
+import os
+
+
+def is_supported_file(path, img_formats):
+    _, ext = os.path.splitext(path.lower())
+    return ext == '.pdf' or ext in img_formats
+
+
+def iter_directory_files(root, img_formats, exclude_dirs=()):
+    """惰性地递归遍历目录，逐个产出支持的文件路径。
+
+    目录内按名称排序，先产出文件再进入子目录；不跟随指向目录的符号链接，
+    跳过 exclude_dirs 中的目录（例如位于被遍历目录内的输出目录）。
+    """
+    excluded = {os.path.normcase(os.path.abspath(path)) for path in exclude_dirs if path}
+    pending_dirs = [root]
+    while pending_dirs:
+        directory = pending_dirs.pop()
+        if os.path.normcase(os.path.abspath(directory)) in excluded:
+            continue
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError as exc:
+            print(f"无法读取文件夹 {directory}: {exc}")
+            continue
+
+        sub_dirs = []
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    sub_dirs.append(entry.path)
+                elif entry.is_file() and is_supported_file(entry.name, img_formats):
+                    yield entry.path
+            except OSError:
+                continue
+        # 栈顶为名称最小的子目录，保证按名称顺序深度优先
+        pending_dirs.extend(reversed(sub_dirs))
+
+
+def iter_input_files(paths, img_formats, exclude_dirs=()):
+    """依次产出 paths 中支持的文件，文件夹递归展开；同一文件只产出一次"""
+    seen = set()
+    for path in paths:
+        if os.path.isdir(path):
+            candidates = iter_directory_files(path, img_formats, exclude_dirs)
+        elif is_supported_file(path, img_formats):
+            candidates = (path,)
+        else:
+            continue
+
+        for file_path in candidates:
+            key = os.path.normcase(os.path.abspath(file_path))
+            if key not in seen:
+                seen.add(key)
+                yield file_path
@@ -0,0 +1,117 @@
+"""监视文件夹：定期扫描文件夹，发现新增或修改且已经写完的PDF/图片后交给回调处理。
+
+只用标准库按固定间隔扫描（每个文件一次 stat），空闲时只在间隔结束时醒来，
+CPU 占用可以忽略。文件大小和修改时间在 settle_seconds 内保持不变、且能以只读
+方式打开，才认为已经写完。监视开始时已经存在的文件不处理；程序自己生成的
+``_cropped`` 输出和输出目录中的文件会被跳过；覆盖原文件模式下，处理完成后记录
+文件的新状态，不会因为自己写回的结果再次触发。
+"""
+import os
+import re
+import threading
+import time
+
+from file_discovery import iter_directory_files
+
+# 默认扫描间隔和判定文件已写完所需的静止时间（秒）
+DEFAULT_INTERVAL = 1.0
+DEFAULT_SETTLE_SECONDS = 2.0
+
+_CROPPED_OUTPUT_PATTERN = re.compile(r"_cropped(_\d+)?$")
+
+
+def is_cropped_output(path):
+    """是否为本程序生成的输出文件（文件名以 _cropped 或 _cropped_N 结尾）"""
+    stem, _ = os.path.splitext(os.path.basename(path))
+    return _CROPPED_OUTPUT_PATTERN.search(stem) is not None
+
+
+def file_signature(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def can_open(path):
+    """写入方仍占用文件时（Windows 上常见）无法打开，视为尚未写完"""
+    try:
+        with open(path, 'rb'):
+            return True
+    except OSError:
+        return False
+
+
+class FolderWatcher:
+    def __init__(self, folders, img_formats, exclude_dirs=(), settle_seconds=DEFAULT_SETTLE_SECONDS):
+        self.folders = list(folders)
+        self.img_formats = img_formats
+        self.exclude_dirs = tuple(exclude_dirs)
+        self.settle_seconds = settle_seconds
+        # 已处理（或监视开始时已存在）的文件状态、正在等待静止的文件、已交出尚未处理完的文件
+        self.processed = {}
+        self.changing = {}
+        self.in_flight = set()
+        self.lock = threading.Lock()
+        self.started = False
+
+    def scan(self):
+        """返回 {路径: (大小, 修改时间)}，跳过本程序的输出文件"""
+        signatures = {}
+        for folder in self.folders:
+            for path in iter_directory_files(folder, self.img_formats, self.exclude_dirs):
+                if is_cropped_output(path):
+                    continue
+                try:
+                    signatures[path] = file_signature(path)
+                except OSError:
+                    continue
+        return signatures
+
+    def poll(self, now=None):
+        """扫描一次，返回已经写完、需要处理的文件，并把它们标记为处理中"""
+        now = time.monotonic() if now is None else now
+        signatures = self.scan()
+        ready = []
+        with self.lock:
+            if not self.started:
+                # 第一次扫描只记录已有文件
+                self.started = True
+                self.processed.update(signatures)
+                return ready
+
+            for path, signature in signatures.items():
+                if path in self.in_flight or self.processed.get(path) == signature:
+                    self.changing.pop(path, None)
+                    continue
+
+                seen = self.changing.get(path)
+                if seen is None or seen[0] != signature:
+                    # 新出现或仍在变化，重新开始计时
+                    self.changing[path] = (signature, now)
+                elif now - seen[1] >= self.settle_seconds and signature[0] > 0 and can_open(path):
+                    del self.changing[path]
+                    self.in_flight.add(path)
+                    ready.append(path)
+
+            # 已删除的文件不再跟踪
+            for path in [path for path in self.changing if path not in signatures]:
+                del self.changing[path]
+            for path in [path for path in self.processed if path not in signatures]:
+                del self.processed[path]
+        return ready
+
+    def mark_done(self, path):
+        """文件处理完成（无论成功与否）后记录它当前的状态，只有再次修改才会重新处理"""
+        with self.lock:
+            self.in_flight.discard(path)
+            try:
+                self.processed[path] = file_signature(path)
+            except OSError:
+                self.processed.pop(path, None)
+
+    def run(self, on_ready, stop_event, interval=DEFAULT_INTERVAL):
+        """循环扫描直到 stop_event 被设置；有文件写完时调用 on_ready(文件列表)"""
+        while not stop_event.is_set():
+            ready = self.poll()
+            if ready:
+                on_ready(ready)
+            stop_event.wait(interval)
@@ -0,0 +1,51 @@
+"""图片内容区域分析。
+
+逐行带把图片转换为RGB的numpy数组并累积内容掩码的行列投影，不需要一次把整张图
+转换成RGB或numpy数组；裁剪输出同样逐行带转换。
+"""
+import numpy as np
+from PIL import Image
+
+from bbox_detect import (
+    IMAGE_MIN_CONTENT_SIZE,
+    IMAGE_THRESHOLD,
+    band_row_count,
+    scan_bands,
+)
+
+
+def iter_image_bands(img, band_rows):
+    """按行带把图片转换为RGB的numpy数组，每次只转换一个行带"""
+    width, height = img.size
+    for y in range(0, height, band_rows):
+        band = img.crop((0, y, width, min(y + band_rows, height)))
+        if band.mode != 'RGB':
+            band = band.convert('RGB')
+        yield y, np.asarray(band)
+
+
+def detect_image_bounds(img, threshold=IMAGE_THRESHOLD):
+    """检测图片内容区域的像素边界（含噪点过滤），没有内容返回 None"""
+    width, height = img.size
+    bounds = scan_bands(iter_image_bands(img, band_row_count(width)), width, height, threshold)
+    if bounds is None:
+        return None
+
+    # 噪点过滤
+    left, top, right, bottom = bounds
+    if (right - left) <= IMAGE_MIN_CONTENT_SIZE or (bottom - top) <= IMAGE_MIN_CONTENT_SIZE:
+        return None
+    return bounds
+
+
+def crop_rgb(img, box):
+    """裁剪出 box 区域并转换为RGB；非RGB图片逐行带转换，不生成整块区域的原模式副本"""
+    if img.mode == 'RGB':
+        return img.crop(box)
+    x0, y0, x1, y1 = box
+    cropped = Image.new('RGB', (x1 - x0, y1 - y0))
+    band_rows = band_row_count(x1 - x0)
+    for y in range(y0, y1, band_rows):
+        band = img.crop((x0, y, x1, min(y + band_rows, y1))).convert('RGB')
+        cropped.paste(band, (0, y - y0))
+    return cropped
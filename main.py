@@ -1,3 +1,8 @@
+import time
+
+# 启动计时起点，尽量放在所有导入之前
+_startup_started = time.perf_counter()
+
 import os
 import sys
 import ctypes
@@ -5,12 +10,138 @@ import subprocess
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 from tkinterdnd2 import DND_FILES, TkinterDnD
-import fitz  # PyMuPDF
 import threading
 import configparser
 import queue
-import numpy as np  # 添加numpy库
-from PIL import Image  # 添加PIL库用于处理图片
+import importlib
+import itertools
+import multiprocessing
+from contextlib import nullcontext
+from config_paths import get_config_path
+from bbox_cache import CACHE_FILENAME, DEFAULT_MAX_ENTRIES
+from file_discovery import is_supported_file, iter_input_files
+from folder_watch import DEFAULT_INTERVAL, DEFAULT_SETTLE_SECONDS, FolderWatcher
+from stage_trace import TRACE_FILENAME, StageTracer, append_trace, stage, summarize_trace
+
+# fitz / numpy / PIL 等图像库较重，由 crop_engine 统一加载；
+# 窗口显示后在后台线程预热，首次使用时再按需导入
+_crop_engine = None
+_crop_engine_lock = threading.Lock()
+
+
+def load_crop_engine():
+    """按需导入裁剪引擎（及其依赖的图像库），可在任意线程中调用"""
+    global _crop_engine
+    with _crop_engine_lock:
+        if _crop_engine is None:
+            _crop_engine = importlib.import_module("crop_engine")
+        return _crop_engine
+
+
+class StartupTimer:
+    """记录启动各阶段耗时，用于检查首屏时间是否超出预算"""
+
+    def __init__(self, started):
+        self.started = started
+        self.last = started
+        self.stages = []
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self.stages.append((name, now - self.last))
+        self.last = now
+
+    def elapsed_ms(self):
+        return (self.last - self.started) * 1000
+
+    def format_report(self, budget_ms):
+        parts = [f"{name} {seconds * 1000:.0f}ms" for name, seconds in self.stages]
+        total_ms = self.elapsed_ms()
+        verdict = "超出预算" if total_ms > budget_ms else "预算内"
+        return f"启动耗时: {' · '.join(parts)} · 首屏 {total_ms:.0f}ms ({verdict}, 预算 {budget_ms}ms)"
+
+
+startup_timer = StartupTimer(_startup_started)
+startup_timer.mark("imports")
+
+# 处理或监视期间主线程检查界面更新的间隔（毫秒），同一间隔内的多次进度更新合并为一次刷新；
+# 空闲时不检查
+UI_REFRESH_INTERVAL_MS = 33
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds + 0.5), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
+
+
+class BatchProgress:
+    """汇总一个批次的文件级和页级进度，计算吞吐量和剩余时间；可在多个线程中更新"""
+
+    def __init__(self):
+        self.total_files = 0
+        self.discovery_finished = False
+        self.started = time.perf_counter()
+        self.finished_files = 0
+        self.finished_pages = 0
+        self.active = {}  # 正在处理的PDF: 输入路径 -> (已分析页数, 总页数)
+        self.page_totals = {}
+        self.finished_paths = set()
+        self.current_path = ""
+        self.lock = threading.Lock()
+
+    def add_file(self):
+        """发现一个待处理文件，进度条最大值随之增加"""
+        with self.lock:
+            self.total_files += 1
+
+    def finish_discovery(self):
+        with self.lock:
+            self.discovery_finished = True
+
+    def update_pages(self, file_path, done, total):
+        with self.lock:
+            if file_path in self.finished_paths:
+                # 并行处理时进度可能晚于完成结果到达，只用来补上页数
+                if file_path not in self.page_totals:
+                    self.finished_pages += total - 1
+                    self.page_totals[file_path] = total
+                return
+            self.active[file_path] = (done, total)
+            self.page_totals[file_path] = total
+            self.current_path = file_path
+
+    def finish_file(self, file_path):
+        with self.lock:
+            self.active.pop(file_path, None)
+            self.finished_paths.add(file_path)
+            self.finished_files += 1
+            # 图片和没有页级进度的文件按 1 页计
+            self.finished_pages += self.page_totals.get(file_path, 1)
+            self.current_path = file_path
+
+    def snapshot(self):
+        """返回 (进度条数值, 进度条最大值, 状态文字)"""
+        with self.lock:
+            elapsed = time.perf_counter() - self.started
+            value = self.finished_files + sum(done / total for done, total in self.active.values() if total)
+            pages = self.finished_pages + sum(done for done, _ in self.active.values())
+
+            # 文件夹还在遍历时总数后面加 “+”
+            total_text = f"{self.total_files}" if self.discovery_finished else f"{self.total_files}+"
+            parts = [f"已处理 {self.finished_files}/{total_text}"]
+            if self.current_path:
+                parts.append(os.path.basename(self.current_path))
+                if self.current_path in self.active:
+                    done, total = self.active[self.current_path]
+                    parts.append(f"第 {done}/{total} 页")
+            if elapsed >= 0.5 and pages:
+                parts.append(f"{pages / elapsed:.1f} 页/s")
+            if self.discovery_finished and 0 < value < self.total_files:
+                parts.append(f"剩余约 {format_duration(elapsed * (self.total_files - value) / value)}")
+            return value, max(1, self.total_files), " · ".join(parts)
 
 # 判断是否在打包环境中运行
 def resource_path(relative_path):
@@ -22,32 +153,6 @@ def resource_path(relative_path):
         base_path = os.path.abspath(".")
     return os.path.join(base_path, relative_path)
 
-def get_config_path(filename):
-    """Resolve a writable config path for both source and packaged runs."""
-    candidate_dirs = []
-    local_appdata = os.environ.get("LOCALAPPDATA")
-    if local_appdata:
-        candidate_dirs.append(os.path.join(local_appdata, "AcademicFigureCropper"))
-
-    home_dir = os.path.expanduser("~")
-    if home_dir:
-        candidate_dirs.append(os.path.join(home_dir, ".academic_figure_cropper"))
-
-    candidate_dirs.append(os.path.abspath("."))
-
-    for directory in candidate_dirs:
-        try:
-            os.makedirs(directory, exist_ok=True)
-            probe_path = os.path.join(directory, ".write_test")
-            with open(probe_path, "w", encoding="utf-8") as probe_file:
-                probe_file.write("ok")
-            os.remove(probe_path)
-            return os.path.join(directory, filename)
-        except OSError:
-            continue
-
-    return os.path.join(os.path.abspath("."), filename)
-
 def enable_high_dpi():
     """Try to make the process DPI-aware on Windows to avoid bitmap-scaled blurry UI."""
     if not sys.platform.startswith("win"):
@@ -112,6 +217,7 @@ class PDFCropperApp:
         self.badge_font = (self.font_family, 9, "bold")
         
         # 支持的图片格式
+        # 与 crop_engine.SUPPORTED_IMG_FORMATS 保持一致，这里不导入引擎以免拖慢启动
         self.supported_img_formats = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif', '.gif')
         
         # 配置样式
@@ -142,6 +248,9 @@ class PDFCropperApp:
         self.is_processing = False
         self.advanced_visible = False
         self.last_output_dir = ""
+        self.folder_watcher = None
+        self.watch_stop_event = None
+        self.watch_pending = []
         self._layout_update_job = None
         self._pending_canvas_width = None
         self._last_canvas_width = None
@@ -151,13 +260,19 @@ class PDFCropperApp:
         self.progress_var = tk.DoubleVar()
         self.progress_var.set(0)
         self.ui_queue = queue.Queue()
+        self.ui_lock = threading.Lock()
+        self.pending_progress = None
+        self.ui_poll_job = None
         
         # 创建UI元素
+        startup_timer.mark("app_init")
         self.create_widgets()
+        startup_timer.mark("create_widgets")
+        self._first_paint_done = False
+        self.root.bind("<Map>", self.on_first_map, add="+")
         
         # 处理的文件列表
         self.processing_files = []
-        self.root.after(50, self.process_ui_queue)
         
     def load_config(self):
         """加载配置文件"""
@@ -190,6 +305,61 @@ class PDFCropperApp:
 
         if 'save_debug_images' not in self.config['Settings']:
             self.config['Settings']['save_debug_images'] = 'False'
+
+        if 'pdf_detect_mode' not in self.config['Settings']:
+            self.config['Settings']['pdf_detect_mode'] = 'raster'
+        if 'pdf_output_mode' not in self.config['Settings']:
+            self.config['Settings']['pdf_output_mode'] = 'rebuild'
+        if 'pdf_save_profile' not in self.config['Settings']:
+            self.config['Settings']['pdf_save_profile'] = 'fast'
+
+        if 'image_frame_crop' not in self.config['Settings']:
+            self.config['Settings']['image_frame_crop'] = 'union'
+
+        if 'worker_count' not in self.config['Settings']:
+            self.config['Settings']['worker_count'] = '0'
+
+        if 'bbox_cache' not in self.config['Settings']:
+            self.config['Settings']['bbox_cache'] = 'True'
+
+        if 'bbox_cache_max_entries' not in self.config['Settings']:
+            self.config['Settings']['bbox_cache_max_entries'] = str(DEFAULT_MAX_ENTRIES)
+
+        if 'startup_report' not in self.config['Settings']:
+            self.config['Settings']['startup_report'] = 'False'
+
+        if 'startup_budget_ms' not in self.config['Settings']:
+            self.config['Settings']['startup_budget_ms'] = '800'
+
+        if 'stage_trace' not in self.config['Settings']:
+            self.config['Settings']['stage_trace'] = 'False'
+
+        if 'render_band_mb' not in self.config['Settings']:
+            self.config['Settings']['render_band_mb'] = '64'
+
+        if 'pdf_page_crop' not in self.config['Settings']:
+            self.config['Settings']['pdf_page_crop'] = 'per_page'
+
+        if 'pdf_uniform_percentile' not in self.config['Settings']:
+            self.config['Settings']['pdf_uniform_percentile'] = '90'
+
+        if 'detect_precision_pt' not in self.config['Settings']:
+            self.config['Settings']['detect_precision_pt'] = '0'
+
+        if 'detect_max_megapixels' not in self.config['Settings']:
+            self.config['Settings']['detect_max_megapixels'] = '40'
+
+        if 'detect_render_profile' not in self.config['Settings']:
+            self.config['Settings']['detect_render_profile'] = 'accurate'
+
+        if 'watch_folder' not in self.config['Settings']:
+            self.config['Settings']['watch_folder'] = ''
+
+        if 'watch_interval' not in self.config['Settings']:
+            self.config['Settings']['watch_interval'] = str(DEFAULT_INTERVAL)
+
+        if 'watch_settle_seconds' not in self.config['Settings']:
+            self.config['Settings']['watch_settle_seconds'] = str(DEFAULT_SETTLE_SECONDS)
     
     def save_config(self):
         """保存配置到文件"""
@@ -300,8 +470,14 @@ class PDFCropperApp:
         )
         self.drop_hint.pack(pady=(6, 12))
 
-        self.pick_button = self.create_flat_button(drop_center_frame, "选择文件", self.select_files, primary=True)
-        self.pick_button.pack()
+        pick_row = tk.Frame(drop_center_frame, bg=self.card_bg_color)
+        pick_row.pack()
+
+        self.pick_button = self.create_flat_button(pick_row, "选择文件", self.select_files, primary=True)
+        self.pick_button.pack(side=tk.LEFT)
+
+        self.watch_button = self.create_flat_button(pick_row, "监视文件夹", self.toggle_watch)
+        self.watch_button.pack(side=tk.LEFT, padx=(8, 0))
 
         status_frame = tk.Frame(self.drop_body, bg=self.card_bg_color)
         status_frame.pack(fill=tk.X, pady=(14, 0))
@@ -328,6 +504,7 @@ class PDFCropperApp:
             self.drop_card,
             self.drop_body,
             drop_center_frame,
+            pick_row,
             self.drop_badge,
             self.drop_label,
             self.drop_hint,
@@ -782,6 +959,91 @@ class PDFCropperApp:
         if files:
             self.process_dropped_files(list(files))
 
+    def toggle_watch(self):
+        """开始或停止监视文件夹"""
+        if self.folder_watcher is not None:
+            self.stop_watch()
+            return
+
+        initial_dir = self.config.get('Settings', 'watch_folder') or os.path.expanduser("~")
+        folder = filedialog.askdirectory(title="选择要监视的文件夹", initialdir=initial_dir)
+        if folder:
+            self.start_watch(folder)
+
+    def start_watch(self, folder):
+        """监视文件夹中新增或修改的文件，写完后按当前的留白和输出设置自动裁剪"""
+        settings = self.get_processing_settings()
+        if not settings['overwrite_original'] and not settings['output_dir']:
+            messagebox.showwarning("警告", "请先选择输出文件夹")
+            return
+
+        self.config['Settings']['watch_folder'] = folder
+        self.save_config()
+
+        exclude_dirs = () if settings['overwrite_original'] else (settings['output_dir'],)
+        self.folder_watcher = FolderWatcher(
+            [folder],
+            self.supported_img_formats,
+            exclude_dirs,
+            self.config.getfloat('Settings', 'watch_settle_seconds', fallback=DEFAULT_SETTLE_SECONDS),
+        )
+        self.watch_stop_event = threading.Event()
+        interval = self.config.getfloat('Settings', 'watch_interval', fallback=DEFAULT_INTERVAL)
+        threading.Thread(
+            target=self.folder_watcher.run,
+            args=(self.on_watch_ready, self.watch_stop_event, interval),
+            daemon=True,
+        ).start()
+
+        self.schedule_ui_poll()
+        self.watch_button.config(text="停止监视")
+        if not self.is_processing:
+            self.status_label.config(fg=self.secondary_text)
+            self.status_var.set(f"正在监视 {folder}")
+
+    def stop_watch(self):
+        self.watch_stop_event.set()
+        self.folder_watcher = None
+        self.watch_stop_event = None
+        self.watch_pending = []
+        self.watch_button.config(text="监视文件夹")
+        if not self.is_processing:
+            self.status_var.set("已停止监视")
+
+    def on_watch_ready(self, files):
+        """监视线程发现写完的文件，转到主线程排队处理"""
+        self.enqueue_ui_call(self.queue_watched_files, files)
+
+    def queue_watched_files(self, files):
+        if self.folder_watcher is None:
+            return
+        self.watch_pending.extend(files)
+        self.start_watched_batch()
+
+    def start_watched_batch(self):
+        """空闲时处理监视到的文件，每批都读取当前的留白和输出设置"""
+        if self.is_processing or not self.watch_pending or self.folder_watcher is None:
+            return
+
+        files, self.watch_pending = self.watch_pending, []
+        settings = self.get_processing_settings()
+        try:
+            if not settings['overwrite_original']:
+                if not settings['output_dir']:
+                    raise OSError("未设置输出文件夹")
+                os.makedirs(settings['output_dir'], exist_ok=True)
+        except OSError as exc:
+            self.status_var.set(f"输出文件夹不可用: {exc}")
+            self.status_label.config(fg=self.warning_color)
+            self.set_drop_area_state("warning")
+            watcher = self.folder_watcher
+            if watcher is not None:
+                for file_path in files:
+                    watcher.mark_done(file_path)
+            return
+
+        self.start_processing(files, settings)
+
     def select_output_dir(self):
         """选择输出目录"""
         initial_dir = self.output_path_var.get().strip() or os.path.expanduser("~")
@@ -846,45 +1108,101 @@ class PDFCropperApp:
                 'bottom': self.bottom_margin_var.get(),
             },
             'save_debug_images': self.save_debug_images,
+            'pdf_detect_mode': self.config.get('Settings', 'pdf_detect_mode'),
+            'detect_precision_pt': self.config.getfloat('Settings', 'detect_precision_pt', fallback=0),
+            'detect_max_megapixels': self.config.getfloat('Settings', 'detect_max_megapixels', fallback=0),
+            'detect_render_profile': self.config.get('Settings', 'detect_render_profile'),
+            'pdf_output_mode': self.config.get('Settings', 'pdf_output_mode'),
+            'pdf_page_crop': self.config.get('Settings', 'pdf_page_crop'),
+            'pdf_uniform_percentile': self.config.getfloat('Settings', 'pdf_uniform_percentile', fallback=0),
+            'pdf_save_profile': self.config.get('Settings', 'pdf_save_profile'),
+            'image_frame_crop': self.config.get('Settings', 'image_frame_crop'),
+            'worker_count': self.config.getint('Settings', 'worker_count', fallback=0),
+            'render_band_mb': self.config.getint('Settings', 'render_band_mb', fallback=0),
+            'bbox_cache_path': get_config_path(CACHE_FILENAME) if self.config.getboolean('Settings', 'bbox_cache') else '',
+            'bbox_cache_max_entries': self.config.getint('Settings', 'bbox_cache_max_entries', fallback=DEFAULT_MAX_ENTRIES),
+            'stage_trace': self.config.getboolean('Settings', 'stage_trace', fallback=False),
         }
 
     def enqueue_ui_call(self, callback, *args, **kwargs):
+        """从工作线程提交界面调用，由主线程的 process_ui_queue 按顺序执行"""
         self.ui_queue.put((callback, args, kwargs))
 
+    def post_progress(self, progress):
+        """从工作线程提交最新进度；两次刷新之间只保留最后一次"""
+        with self.ui_lock:
+            self.pending_progress = progress
+
+    def schedule_ui_poll(self):
+        """在主线程中调用：尚未安排时安排下一次 process_ui_queue"""
+        if self.ui_poll_job is None:
+            self.ui_poll_job = self.root.after(UI_REFRESH_INTERVAL_MS, self.process_ui_queue)
+
     def process_ui_queue(self):
+        """在主线程中定时执行：Tk 只能在主线程中调用，后台线程只写入队列和进度。
+
+        处理或监视结束且队列已清空后不再安排下一次。
+        """
+        self.ui_poll_job = None
+        with self.ui_lock:
+            progress, self.pending_progress = self.pending_progress, None
+
+        if progress is not None:
+            value, maximum, status = progress.snapshot()
+            self.progress.config(maximum=maximum)
+            self.progress_var.set(value)
+            self.status_var.set(status)
+
         try:
             while True:
                 callback, args, kwargs = self.ui_queue.get_nowait()
                 callback(*args, **kwargs)
         except queue.Empty:
             pass
-        finally:
-            self.root.after(50, self.process_ui_queue)
 
-    def build_output_path(self, file_path, settings, reserved_paths):
-        if settings['overwrite_original']:
-            return file_path
+        if self.is_processing or self.folder_watcher is not None or not self.ui_queue.empty():
+            self.schedule_ui_poll()
+
+    def on_first_map(self, event):
+        """窗口第一次显示后记录首屏时间，并在后台预热图像库"""
+        if event.widget is not self.root or self._first_paint_done:
+            return
+        self._first_paint_done = True
+        self.root.after_idle(self.finish_startup)
+
+    def finish_startup(self):
+        startup_timer.mark("first_paint")
+        threading.Thread(target=load_crop_engine, daemon=True).start()
 
-        output_dir = settings['output_dir']
-        output_name = os.path.basename(file_path)
-        base_name, ext = os.path.splitext(output_name)
-        candidate = os.path.join(output_dir, f"{base_name}_cropped{ext}")
-        candidate_key = os.path.normcase(os.path.abspath(candidate))
-        suffix = 2
+        budget_ms = self.config.getint('Settings', 'startup_budget_ms', fallback=800)
+        over_budget = startup_timer.elapsed_ms() > budget_ms
+        if not (self.config.getboolean('Settings', 'startup_report', fallback=False) or over_budget):
+            return
 
-        while candidate_key in reserved_paths or os.path.exists(candidate):
-            candidate = os.path.join(output_dir, f"{base_name}_cropped_{suffix}{ext}")
-            candidate_key = os.path.normcase(os.path.abspath(candidate))
-            suffix += 1
+        report = startup_timer.format_report(budget_ms)
+        print(report)
+        # 打包后没有控制台，同时写到配置文件旁边
+        try:
+            report_path = os.path.join(os.path.dirname(self.config_file), "startup_report.txt")
+            with open(report_path, 'w', encoding='utf-8') as f:
+                f.write(report + "\n")
+        except OSError as exc:
+            print(f"保存启动耗时报告失败: {exc}")
 
-        reserved_paths.add(candidate_key)
-        return candidate
+    def build_output_path(self, file_path, settings, name_index):
+        return load_crop_engine().build_output_path(file_path, settings, name_index)
 
-    def finish_processing(self, total_success, total_failed, failed_messages):
+    def finish_processing(self, total_success, total_failed, failed_messages, batch_summary=""):
         self.is_processing = False
+        summary_suffix = f" · {batch_summary}" if batch_summary else ""
 
-        if total_failed > 0:
-            self.status_var.set(f"处理完成: {total_success} 成功, {total_failed} 失败")
+        if total_success == 0 and total_failed == 0:
+            # 拖入的文件夹里没有支持的文件
+            self.status_var.set("没有检测到支持的文件")
+            self.status_label.config(fg=self.warning_color)
+            self.set_drop_area_state("warning")
+        elif total_failed > 0:
+            self.status_var.set(f"处理完成: {total_success} 成功, {total_failed} 失败{summary_suffix}")
             self.status_label.config(fg=self.warning_color)
             self.set_drop_area_state("warning")
             summary = "\n".join(failed_messages[:6])
@@ -892,9 +1210,12 @@ class PDFCropperApp:
                 summary += f"\n... 另有 {len(failed_messages) - 6} 个文件失败"
             messagebox.showwarning("处理完成", f"成功: {total_success} 个文件\n失败: {total_failed} 个文件\n\n{summary}")
         else:
-            self.status_var.set(f"已完成 {total_success} 个文件")
+            self.status_var.set(f"已完成 {total_success} 个文件{summary_suffix}")
             self.status_label.config(fg=self.success_color)
             self.set_drop_area_state("success")
+
+        # 处理期间监视文件夹中又有文件写完
+        self.start_watched_batch()
     
     def drop(self, event):
         """处理文件拖放事件"""
@@ -904,19 +1225,18 @@ class PDFCropperApp:
         self.process_dropped_files(files)
     
     def parse_drop_data(self, data):
-        """解析拖放的文件路径数据"""
+        """解析拖放的文件路径数据，保留支持的文件和文件夹（文件夹在处理时再递归遍历）"""
         files = []
         for item in self.root.tk.splitlist(data):
             # 处理可能的引号和花括号（Windows路径特性）
             item = item.strip('{}')
             # 检查文件扩展名
-            _, ext = os.path.splitext(item.lower())
-            if ext == '.pdf' or ext in self.supported_img_formats:
+            if os.path.isdir(item) or is_supported_file(item, self.supported_img_formats):
                 files.append(item)
         return files
     
     def process_dropped_files(self, files):
-        """处理拖放的文件"""
+        """处理拖放的文件和文件夹"""
         if self.is_processing:
             messagebox.showinfo("请稍候", "当前还有文件在处理中")
             return
@@ -948,320 +1268,121 @@ class PDFCropperApp:
                 messagebox.showerror("错误", f"无法创建输出文件夹:\n{exc}")
                 return
 
+        self.start_processing(files, settings)
+
+    def start_processing(self, files, settings):
+        """开始处理一批文件（输出设置已检查）"""
         self.update_output_path_buttons()
         self.is_processing = True
         self.last_output_dir = settings['output_dir'] if not settings['overwrite_original'] else ""
         self.progress_var.set(0)
-        self.progress.config(maximum=len(files))
+        self.progress.config(maximum=max(1, len(files)))
 
         # 更新UI反馈
         self.status_label.config(fg=self.secondary_text)
         self.set_drop_area_state("processing")
-        self.status_var.set(f"开始处理 {len(files)} 个文件...")
+        if any(os.path.isdir(item) for item in files):
+            self.status_var.set("正在查找文件并开始处理...")
+        else:
+            self.status_var.set(f"开始处理 {len(files)} 个文件...")
 
         # 开始处理线程
+        self.schedule_ui_poll()
         threading.Thread(target=self.process_files_thread, args=(files, settings), daemon=True).start()
 
     def process_files_thread(self, files, settings):
-        """在单独的线程中处理文件"""
+        """在单独的线程中调度文件处理，多个文件时分发到工作进程并行裁剪。
+
+        文件夹边遍历边把发现的文件交给工作进程，不等待整棵目录树列完。
+        """
         total_success = 0
         total_failed = 0
-        reserved_output_paths = set()
         failed_messages = []
-
-        for i, file_path in enumerate(files):
-            try:
-                filename = os.path.basename(file_path)
-                self.enqueue_ui_call(self.status_var.set, f"正在处理 {i + 1}/{len(files)} · {filename}")
-
-                # 确定输出路径
-                output_path = self.build_output_path(file_path, settings, reserved_output_paths)
-
-                # 根据文件类型选择处理方法
-                _, ext = os.path.splitext(file_path.lower())
-                if ext == '.pdf':
-                    self.crop_pdf(file_path, output_path, settings)
-                elif ext in self.supported_img_formats:
-                    self.crop_image(file_path, output_path, settings['margins'])
-
-                # 更新进度
-                self.enqueue_ui_call(self.progress_var.set, i + 1)
-                total_success += 1
-
-            except Exception as e:
-                total_failed += 1
-                failed_messages.append(f"{os.path.basename(file_path)}: {str(e)}")
-
-        self.enqueue_ui_call(self.finish_processing, total_success, total_failed, failed_messages)
-
-    def crop_image(self, input_path, output_path, margins):
-        """剪裁图片白边"""
-        # 打开图片
-        img = Image.open(input_path)
-        
-        # 确保图片是RGB模式，以便于处理
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
-        
-        # 将图片转换为numpy数组
-        np_img = np.array(img)
-        
-        # 计算图片亮度
-        brightness = np.mean(np_img, axis=2)
-        
-        # 使用阈值确定非白色像素
-        threshold = 225
-        mask = brightness < threshold
-        
-        # 找到内容区域边界
-        if np.any(mask):  # 如果有任何内容
-            rows = np.where(np.any(mask, axis=1))[0]
-            cols = np.where(np.any(mask, axis=0))[0]
-            
-            if len(rows) > 0 and len(cols) > 0:
-                min_y, max_y = np.min(rows), np.max(rows)
-                min_x, max_x = np.min(cols), np.max(cols)
-                
-                # 噪点过滤
-                min_content_size = 10
-                if (max_x - min_x) > min_content_size and (max_y - min_y) > min_content_size:
-                    # 获取边距设置
-                    left_margin = margins['left']
-                    top_margin = margins['top']
-                    right_margin = margins['right']
-                    bottom_margin = margins['bottom']
-                    
-                    # 计算裁剪区域（添加边距）
-                    x1 = max(min_x - left_margin, 0)
-                    y1 = max(min_y - top_margin, 0)
-                    x2 = min(max_x + right_margin, np_img.shape[1])
-                    y2 = min(max_y + bottom_margin, np_img.shape[0])
-                    
-                    # 内容区域有效性验证
-                    width, height = np_img.shape[1], np_img.shape[0]
-                    
-                    # 防止裁剪过多 - 如果内容区域太小，可能是错误检测
-                    if (x2 - x1) < width * 0.1 or (y2 - y1) < height * 0.1:
-                        x1, y1, x2, y2 = 0, 0, width, height
-                    
-                    # 防止裁剪过少 - 如果内容区域几乎和页面一样大，微调一下裁剪区域
-                    if (x2 - x1) > width * 0.98 or (y2 - y1) > height * 0.98:
-                        margin_x = width * 0.02
-                        margin_y = height * 0.02
-                        x1, y1 = margin_x, margin_y
-                        x2, y2 = width - margin_x, height - margin_y
-                    
-                    # 裁剪图片
-                    cropped_img = img.crop((x1, y1, x2, y2))
-                    
-                    # 保存裁剪后的图片
-                    if input_path == output_path:
-                        # 如果覆盖原文件，先保存为临时文件再替换
-                        temp_path = output_path + ".temp"
-                        # 获取原文件的扩展名
-                        _, ext = os.path.splitext(input_path)
-                        # 确保临时文件保留原始扩展名
-                        cropped_img.save(temp_path, format=self.get_image_format(ext))
-                        cropped_img.close()
-                        img.close()
-                        os.replace(temp_path, output_path)
-                    else:
-                        # 直接保存到新位置
-                        _, ext = os.path.splitext(output_path)
-                        cropped_img.save(output_path, format=self.get_image_format(ext))
-                        cropped_img.close()
-                        img.close()
-                    return
-        
-        # 如果没有检测到内容或检测失败，保存原图
-        if input_path != output_path:
-            _, ext = os.path.splitext(output_path)
-            img.save(output_path, format=self.get_image_format(ext))
-        img.close()
-    
-    def get_image_format(self, ext):
-        """根据文件扩展名获取图片格式"""
-        ext = ext.lower().strip('.')
-        # 处理特殊情况
-        if ext == 'jpg':
-            return 'JPEG'
-        elif ext == 'tif':
-            return 'TIFF'
-        elif ext in ('jpeg', 'png', 'bmp', 'tiff', 'gif'):
-            return ext.upper()
-        # 默认返回PNG格式
-        return 'PNG'
-    
-    def crop_pdf(self, input_path, output_path, settings):
-        """剪裁PDF文件白边"""
-        # 打开PDF文件
-        doc = fitz.open(input_path)
-        
-        # 创建新文档用于保存
-        new_doc = fitz.open()
-        
-        # 获取边距设置
-        margins = settings['margins']
-        left_margin = margins['left']
-        top_margin = margins['top']
-        right_margin = margins['right']
-        bottom_margin = margins['bottom']
-
-        # 创建调试输出目录
-        debug_dir = None
-        if settings.get('save_debug_images'):
-            debug_dir = os.path.join(os.path.dirname(output_path), "debug_output")
-            os.makedirs(debug_dir, exist_ok=True)
-        
-        # 处理每一页
-        for page_num in range(len(doc)):
-            try:
-                page = doc.load_page(page_num)
-                
-                # 获取页面的边界框
-                rect = page.rect
-                
-                # 使用pixmap分析页面内容
+        file_stats = []
+        progress = BatchProgress()
+
+        def on_page_progress(file_path, done, total):
+            progress.update_pages(file_path, done, total)
+            self.post_progress(progress)
+
+        # 启用分阶段跟踪时，调度过程本身也记录为一个批次级的跟踪
+        batch_tracer = StageTracer(None) if settings.get('stage_trace') else nullcontext()
+        def discovered_jobs():
+            nonlocal total_failed
+            # 输出目录位于拖入的文件夹内时跳过，避免把刚生成的文件再处理一遍
+            exclude_dirs = () if settings['overwrite_original'] else (settings['output_dir'],)
+            for file_path in iter_input_files(files, self.supported_img_formats, exclude_dirs):
+                progress.add_file()
+                # 输出路径统一在调度线程中分配，并行处理时也不会重名
                 try:
-                    # 提高分辨率以获取更精确的边界
-                    pix = page.get_pixmap(matrix=fitz.Matrix(3, 3), alpha=False)  # 增加到10倍采样
-                    img_data = pix.samples
-                    width, height = pix.width, pix.height
-                    
-                    # 使用numpy处理图像数据
-                    channels = pix.n
-                    # 将原始数据转换为numpy数组
-                    np_img = np.frombuffer(img_data, dtype=np.uint8).reshape(height, width, channels)
-                    
-                    # 保存原始图像用于调试
-                    if debug_dir:
-                        debug_img_path = os.path.join(debug_dir, f"page_{page_num+1}_original.png")
-                        Image.fromarray(np_img).save(debug_img_path)
-                    
-                    # 计算亮度 - 对于RGB图像取平均值，对于灰度图像直接使用值
-                    if channels >= 3:
-                        # 对于RGB或RGBA图像
-                        brightness = np.mean(np_img[:, :, :3], axis=2)
-                    else:
-                        # 对于灰度图像
-                        brightness = np_img[:, :, 0]
-                    
-                    # 保存亮度图用于调试
-                    if debug_dir:
-                        debug_brightness_path = os.path.join(debug_dir, f"page_{page_num+1}_brightness.png")
-                        Image.fromarray(brightness.astype(np.uint8)).save(debug_brightness_path)
-                    
-                    # 根据阈值创建掩码
-                    threshold = 245  # 阈值
-                    mask = brightness < threshold
-                    
-                    # 保存掩码图用于调试
-                    if debug_dir:
-                        debug_mask_path = os.path.join(debug_dir, f"page_{page_num+1}_mask.png")
-                        Image.fromarray((mask * 255).astype(np.uint8)).save(debug_mask_path)
-                    
-                    # 根据掩码找到内容区域边界
-                    if np.any(mask):  # 如果有任何内容
-                        # 从四个方向向中间扫描
-                        # 从左向右扫描
-                        left_bound = 0
-                        for x in range(width):
-                            if np.any(mask[:, x]):
-                                left_bound = x
-                                break
-                        
-                        # 从右向左扫描
-                        right_bound = width - 1
-                        for x in range(width-1, -1, -1):
-                            if np.any(mask[:, x]):
-                                right_bound = x
-                                break
-                        
-                        # 从上向下扫描
-                        top_bound = 0
-                        for y in range(height):
-                            if np.any(mask[y, :]):
-                                top_bound = y
-                                break
-                        
-                        # 从下向上扫描
-                        bottom_bound = height - 1
-                        for y in range(height-1, -1, -1):
-                            if np.any(mask[y, :]):
-                                bottom_bound = y
-                                break
-                        
-                        # 将像素坐标转换回页面坐标
-                        min_x = left_bound * rect.width / width
-                        min_y = top_bound * rect.height / height
-                        max_x = right_bound * rect.width / width
-                        max_y = bottom_bound * rect.height / height
-                        
-                        content_rect = fitz.Rect(min_x, min_y, max_x, max_y)
-                        
-                        # 创建可视化图像，在原始图像上绘制检测到的内容区域
-                        if debug_dir and channels >= 3:
-                            debug_visual_path = os.path.join(debug_dir, f"page_{page_num+1}_content_rect.png")
-                            visual_img = np_img.copy()
-                            # 绘制矩形边界
-                            visual_img[top_bound:bottom_bound+1, left_bound:left_bound+5] = [255, 0, 0]  # 左边界
-                            visual_img[top_bound:bottom_bound+1, right_bound-4:right_bound+1] = [255, 0, 0]  # 右边界
-                            visual_img[top_bound:top_bound+5, left_bound:right_bound+1] = [255, 0, 0]  # 上边界
-                            visual_img[bottom_bound-4:bottom_bound+1, left_bound:right_bound+1] = [255, 0, 0]  # 下边界
-                            Image.fromarray(visual_img).save(debug_visual_path)
-                    else:
-                        content_rect = rect  # 未发现内容，使用整个页面
+                    with stage('output_path'):
+                        output_path = self.build_output_path(file_path, settings, output_names)
                 except Exception as e:
-                    print(f"像素分析出错: {str(e)}")
-                    content_rect = rect  # 出错时使用整个页面
-                
-                # 内容区域有效性验证
-                # 防止裁剪过多 - 如果内容区域太小，可能是错误检测
-                # if content_rect.width < rect.width * 0.1 or content_rect.height < rect.height * 0.1:
-                #     print(f"检测到的内容区域过小，使用整个页面: {content_rect}")
-                #     content_rect = rect
-                
-                # 防止裁剪过少 - 如果内容区域几乎和页面一样大，微调一下裁剪区域
-                # if content_rect.width > rect.width * 0.98 or content_rect.height > rect.height * 0.98:
-                #     margin_x = rect.width * 0.02
-                #     margin_y = rect.height * 0.02
-                #     content_rect = fitz.Rect(margin_x, margin_y, rect.width - margin_x, rect.height - margin_y)
-                
-                # 应用边距
-                crop_box = fitz.Rect(
-                    max(content_rect.x0 - left_margin, 0),
-                    max(content_rect.y0 - top_margin, 0),
-                    min(content_rect.x1 + right_margin, rect.width),
-                    min(content_rect.y1 + bottom_margin, rect.height)
-                )
-                
-                # 确保裁剪框不超出页面边界
-                crop_box = crop_box & rect
-                
-                # 创建新页面并插入裁剪后的内容
-                new_page = new_doc.new_page(width=crop_box.width, height=crop_box.height)
-                new_page.show_pdf_page(new_page.rect, doc, page_num, clip=crop_box)
-                
-            except Exception as e:
-                # 如果处理当前页面出错，保留原始页面
-                print(f"处理第 {page_num+1} 页时出错: {str(e)}")
-                page = doc.load_page(page_num)
-                new_page = new_doc.new_page(width=page.rect.width, height=page.rect.height)
-                new_page.show_pdf_page(new_page.rect, doc, page_num)
-        
-        # 如果是覆盖原文件，先保存为临时文件，然后替换
-        if input_path == output_path:
-            temp_path = output_path + ".temp"
-            new_doc.save(temp_path)
-            new_doc.close()
-            doc.close()
-            os.replace(temp_path, output_path)
-        else:
-            # 直接保存到新位置
-            new_doc.save(output_path)
-            new_doc.close()
-            doc.close()
-    
+                    total_failed += 1
+                    failed_messages.append(f"{os.path.basename(file_path)}: {str(e)}")
+                    progress.finish_file(file_path)
+                    # 只读取一次：用户可能在批处理中途停止监视
+                    watcher = self.folder_watcher
+                    if watcher is not None:
+                        watcher.mark_done(file_path)
+                    continue
+                self.post_progress(progress)
+                yield file_path, output_path
+            progress.finish_discovery()
+            self.post_progress(progress)
+
+        batch_summary = ""
+        try:
+            with batch_tracer:
+                with stage('batch'):
+                    crop_engine = load_crop_engine()
+                    output_names = crop_engine.OutputNameIndex(settings['output_dir'])
+                    # 先取两个任务：只有一个文件时不启动进程池，保留该文件的页段并行
+                    jobs = discovered_jobs()
+                    first_jobs = list(itertools.islice(jobs, 2))
+                    job_count = len(first_jobs) if len(first_jobs) < 2 else None
+                    worker_count = crop_engine.resolve_worker_count(settings.get('worker_count'), job_count)
+                    results = crop_engine.run_crop_jobs(
+                        itertools.chain(first_jobs, jobs), settings, worker_count, on_progress=on_page_progress
+                    )
+                    for file_path, _, error, stats in results:
+                        filename = os.path.basename(file_path)
+                        if error is None:
+                            total_success += 1
+                            if stats:
+                                file_stats.append(stats)
+                        else:
+                            total_failed += 1
+                            failed_messages.append(f"{filename}: {str(error)}")
+
+                        # 记录文件处理后的状态，覆盖原文件时不会被监视再次触发
+                        watcher = self.folder_watcher
+                        if watcher is not None:
+                            watcher.mark_done(file_path)
+
+                        # 更新进度（按刷新间隔合并）
+                        progress.finish_file(file_path)
+                        self.post_progress(progress)
+
+            summaries = [crop_engine.summarize_save_stats(settings.get('pdf_save_profile'), file_stats)]
+            if settings.get('stage_trace'):
+                trace_records = batch_tracer.records + [
+                    record for stats in file_stats for record in stats.get('trace', [])
+                ]
+                try:
+                    append_trace(get_config_path(TRACE_FILENAME), trace_records)
+                except OSError as exc:
+                    print(f"写入阶段跟踪失败: {exc}")
+                summaries.append(summarize_trace(trace_records))
+
+            batch_summary = " · ".join(summary for summary in summaries if summary)
+        except Exception as e:
+            # 调度本身出错时也要结束处理状态，否则界面会一直停在处理中
+            total_failed += 1
+            failed_messages.append(f"批处理中断: {str(e)}")
+        finally:
+            self.enqueue_ui_call(self.finish_processing, total_success, total_failed, failed_messages, batch_summary)
+
     
     def on_frame_configure(self, event):
         """合并内容区布局更新，避免缩放时频繁重排。"""
@@ -1334,6 +1455,7 @@ def main():
     # 创建TkinterDnD应用
     enable_high_dpi()
     root = TkinterDnD.Tk()
+    startup_timer.mark("tk_init")
     try:
         root.tk.call("tk", "scaling", root.winfo_fpixels("1i") / 72.0)
     except tk.TclError:
@@ -1342,4 +1464,6 @@ def main():
     root.mainloop()
 
 if __name__ == "__main__":
+    # 打包后的程序启动工作进程时需要
+    multiprocessing.freeze_support()
     main()
@@ -0,0 +1,441 @@
+"""PDF页面内容区域分析。
+
+栅格模式先低分辨率粗定位，再对四条边做高分辨率局部精修；
+矢量模式直接根据页面显示列表的几何范围计算，不做渲染。
+超过 band_bytes 的渲染按行带进行，海报等超大页面的内存峰值也有上限。
+精确检测的渲染倍率按目标精度和像素预算逐页确定（见 detect_zoom）。
+"""
+import bisect
+import math
+from contextlib import contextmanager
+
+import fitz  # PyMuPDF
+import numpy as np
+
+from bbox_detect import PDF_THRESHOLD, band_row_count, scan_bands
+from stage_trace import stage
+
+# 精确检测默认的渲染倍率，即默认精度为 1/3 pt
+DETECT_ZOOM = 3
+# 精确检测时整页渲染的像素数上限，超大页面按此降低倍率
+DETECT_PIXEL_BUDGET = 40_000_000
+# 粗定位渲染倍率与精确检测倍率之比。粗定位时每个像素的覆盖率是精确检测时的 1/4，
+# 精确检测下刚好可见（低于阈值约 10 级）的细小标记在粗定位中仍低于 255 约 2 级；
+# 倍率再低时，半径约 0.1 pt 的小点等会在粗定位中完全消失，之后的精修也找不回来
+COARSE_SCALE = 0.5
+# 粗定位时低分辨率抗锯齿会冲淡细线，只要不是纯白就视为内容
+COARSE_THRESHOLD = 254
+# 统一裁剪时只做一遍低分辨率检测使用的渲染倍率
+UNIFORM_ZOOM = 1
+# 精修条带在粗定位边界两侧各扩展的宽度（页面坐标，pt）
+EDGE_PAD = 6
+# 检测渲染方案：accurate 与屏幕显示一致；fast 不渲染注释，精确检测时降低抗锯齿级别。
+# 粗定位始终使用完整抗锯齿，避免低分辨率下漏掉细线；精修时边缘最多偏移一个像素，
+# 即不超过检测精度
+RENDER_PROFILES = {
+    'accurate': {'annots': True, 'aa_level': None},
+    'fast': {'annots': False, 'aa_level': 2},
+}
+DEFAULT_RENDER_PROFILE = 'accurate'
+
+# 检测渲染时单个行带的内存上限（字节）
+RENDER_BAND_BYTES = 64 << 20
+# 渲染结果每个像素占用的内存（RGB pixmap，numpy 数组直接引用其像素内存）
+RENDER_BYTES_PER_PIXEL = 3
+# 行带上下额外渲染的宽度（页面坐标，pt），线条不会在行带边界处被截断
+BAND_OVERLAP = 12
+
+
+def detect_zoom(rect, precision=None, pixel_budget=DETECT_PIXEL_BUDGET):
+    """精确检测的渲染倍率：一个像素对应 precision pt（未设置时为 DETECT_ZOOM 倍），
+    整页像素数超过 pixel_budget 时降低倍率"""
+    zoom = 1 / precision if precision else DETECT_ZOOM
+    area = rect.width * rect.height
+    if pixel_budget and area * zoom * zoom > pixel_budget:
+        zoom = math.sqrt(pixel_budget / area)
+    return zoom
+
+
+@contextmanager
+def antialias_level(level):
+    """临时设置 MuPDF 的抗锯齿级别（0-8，对当前进程全局生效），level 为 None 时不改变"""
+    if level is None:
+        yield
+        return
+    previous = fitz.TOOLS.show_aa_level()
+    fitz.TOOLS.set_aa_level(level)
+    try:
+        yield
+    finally:
+        # set_aa_level 会同时设置图形和文字两个级别，原来两者不同时需分别恢复
+        fitz.mupdf.fz_set_graphics_aa_level(previous['graphics'])
+        fitz.mupdf.fz_set_text_aa_level(previous['text'])
+
+
+def render_page_array(page, zoom, clip=None, annots=True):
+    """渲染页面（或其中一块区域），返回 (numpy图像, pixmap)。
+
+    numpy图像直接引用 pixmap 的像素内存，不复制；使用图像期间必须保留 pixmap。
+    """
+    with stage('render'):
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=clip, alpha=False, annots=annots)
+    np_img = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+    return np_img, pix
+
+
+def page_pixel_size(page, zoom):
+    """整页按 zoom 渲染时的像素宽高"""
+    irect = (page.rect * fitz.Matrix(zoom, zoom)).irect
+    return irect.width, irect.height
+
+
+def pixel_bounds_to_rect(bounds, rect, width, height):
+    """将像素坐标转换回页面坐标"""
+    left_bound, top_bound, right_bound, bottom_bound = bounds
+    return fitz.Rect(
+        left_bound * rect.width / width,
+        top_bound * rect.height / height,
+        right_bound * rect.width / width,
+        bottom_bound * rect.height / height,
+    )
+
+
+def region_irect(page, region, zoom):
+    """region 区域（限制在页面内）按 zoom 渲染时的像素矩形"""
+    matrix = fitz.Matrix(zoom, zoom)
+    return (region * matrix).irect & (page.rect * matrix).irect
+
+
+def render_bands(page, zoom, region, band_bytes=RENDER_BAND_BYTES, annots=True):
+    """渲染页面中的 region 区域，逐块产出 (相对区域顶部的起始行, 图像块)。
+
+    图像块按 bbox_detect 计算掩码的行带大小切分。内存不超过 band_bytes 时
+    一次渲染整个区域；否则按整像素行分段渲染，每段上下多渲染 BAND_OVERLAP
+    再裁掉，避免线条在分段处被截断后抗锯齿结果不同。
+    """
+    irect = region_irect(page, region, zoom)
+    mask_rows = band_row_count(irect.width)
+    row_bytes = irect.width * RENDER_BYTES_PER_PIXEL
+    if irect.height * row_bytes <= band_bytes:
+        # pix 在生成器结束前一直保留，产出的图像块可以直接引用它的内存
+        np_img, pix = render_page_array(page, zoom, None if region == page.rect else region, annots)
+        for offset in range(0, np_img.shape[0], mask_rows):
+            yield offset, np_img[offset:offset + mask_rows]
+        return
+
+    overlap = math.ceil(BAND_OVERLAP * zoom)
+    band_rows = max(1, band_bytes // row_bytes - 2 * overlap)
+    for row in range(irect.y0, irect.y1, band_rows):
+        end = min(row + band_rows, irect.y1)
+        clip = fitz.Rect(
+            irect.x0 / zoom,
+            max(irect.y0, row - overlap) / zoom,
+            irect.x1 / zoom,
+            min(irect.y1, end + overlap) / zoom,
+        )
+        np_img, pix = render_page_array(page, zoom, clip, annots)
+        skip = row - pix.y
+        # 产出副本，渲染下一段之前这一段的内存即可释放
+        for offset in range(0, end - row, mask_rows):
+            yield row - irect.y0 + offset, np_img[skip + offset:skip + min(offset + mask_rows, end - row)].copy()
+        del np_img, pix
+
+
+def scan_region(page, region, zoom, threshold, band_bytes=RENDER_BAND_BYTES, annots=True):
+    """分行带渲染 region 区域并检测内容边界，返回 (边界, 区域像素矩形)。
+
+    边界已换算为整页像素坐标，区域内没有内容时为 None。
+    """
+    irect = region_irect(page, region, zoom)
+    bands = render_bands(page, zoom, region, band_bytes, annots)
+    bounds = scan_bands(bands, irect.width, irect.height, threshold)
+    if bounds is None:
+        return None, irect
+    left, top, right, bottom = bounds
+    return (left + irect.x0, top + irect.y0, right + irect.x0, bottom + irect.y0), irect
+
+
+def detect_full_bounds(page, zoom=DETECT_ZOOM, threshold=PDF_THRESHOLD, band_bytes=RENDER_BAND_BYTES, annots=True):
+    """整页渲染并检测内容边界，返回整页像素坐标下的边界，没有内容返回 None"""
+    bounds, _ = scan_region(page, page.rect, zoom, threshold, band_bytes, annots)
+    return bounds
+
+
+def refine_bounds(page, coarse_rect, zoom=DETECT_ZOOM, threshold=PDF_THRESHOLD, pad=EDGE_PAD,
+                  band_bytes=RENDER_BAND_BYTES, annots=True):
+    """在粗定位矩形的四条边附近渲染高分辨率条带，得到精确的像素边界。
+
+    粗定位结果不可靠（条带里没有内容，或内容一直延伸到条带外侧）时返回 None，
+    由调用方退回整页渲染。
+    """
+    rect = page.rect
+    outer = fitz.Rect(coarse_rect.x0 - pad, coarse_rect.y0 - pad, coarse_rect.x1 + pad, coarse_rect.y1 + pad) & rect
+    width, height = page_pixel_size(page, zoom)
+
+    strips = {
+        'left': fitz.Rect(outer.x0, outer.y0, min(coarse_rect.x0 + pad, outer.x1), outer.y1),
+        'right': fitz.Rect(max(coarse_rect.x1 - pad, outer.x0), outer.y0, outer.x1, outer.y1),
+        'top': fitz.Rect(outer.x0, outer.y0, outer.x1, min(coarse_rect.y0 + pad, outer.y1)),
+        'bottom': fitz.Rect(outer.x0, max(coarse_rect.y1 - pad, outer.y0), outer.x1, outer.y1),
+    }
+
+    edges = {}
+    for side, clip in strips.items():
+        if clip.is_empty:
+            return None
+        bounds, strip = scan_region(page, clip, zoom, threshold, band_bytes, annots)
+        if bounds is None:
+            return None
+
+        left, top, right, bottom = bounds
+        if side == 'left':
+            edges[side] = left
+            touches_outside = left == strip.x0 and strip.x0 > 0
+        elif side == 'right':
+            edges[side] = right
+            touches_outside = right == strip.x1 - 1 and strip.x1 < width
+        elif side == 'top':
+            edges[side] = top
+            touches_outside = top == strip.y0 and strip.y0 > 0
+        else:
+            edges[side] = bottom
+            touches_outside = bottom == strip.y1 - 1 and strip.y1 < height
+
+        # 内容一直延伸到条带外侧，说明粗定位漏掉了一部分
+        if touches_outside:
+            return None
+
+    return edges['left'], edges['top'], edges['right'], edges['bottom']
+
+
+def detect_page_bbox(page, zoom=DETECT_ZOOM, threshold=PDF_THRESHOLD, band_bytes=RENDER_BAND_BYTES,
+                     profile=DEFAULT_RENDER_PROFILE):
+    """检测页面内容区域（页面坐标），没有内容时返回 None。
+
+    先以 zoom * COARSE_SCALE 渲染整页找出大致边界，再只对四条边附近的窄条做
+    zoom 倍率渲染。精确检测下可见的细小标记在粗定位中通常也能看到，结果与整页
+    zoom 倍率渲染一致；但这不是严格保证，粗定位中完全消失的标记会被漏掉。
+    """
+    rect = page.rect
+    width, height = page_pixel_size(page, zoom)
+    options = RENDER_PROFILES[profile]
+    annots = options['annots']
+
+    coarse_zoom = zoom * COARSE_SCALE
+    coarse_bounds, coarse_irect = scan_region(page, rect, coarse_zoom, COARSE_THRESHOLD, band_bytes, annots)
+
+    bounds = None
+    if coarse_bounds is not None:
+        left, top, right, bottom = coarse_bounds
+        coarse_rect = fitz.Rect(
+            left * rect.width / coarse_irect.width,
+            top * rect.height / coarse_irect.height,
+            (right + 1) * rect.width / coarse_irect.width,
+            (bottom + 1) * rect.height / coarse_irect.height,
+        )
+        with antialias_level(options['aa_level']):
+            bounds = refine_bounds(page, coarse_rect, zoom, threshold, band_bytes=band_bytes, annots=annots)
+
+    if bounds is None:
+        # 空白页或粗定位不可靠时，退回整页高分辨率渲染
+        with antialias_level(options['aa_level']):
+            bounds = detect_full_bounds(page, zoom, threshold, band_bytes, annots)
+        if bounds is None:
+            return None
+
+    return pixel_bounds_to_rect(bounds, rect, width, height)
+
+
+# 矢量模式下只有这些显示列表条目会落下可见墨迹
+_PATH_KINDS = ('fill-path', 'stroke-path')
+_TEXT_KINDS = ('fill-text', 'stroke-text')
+# 图片/渐变内部可能带白边，只根据几何范围无法确定真实边界
+_RASTER_KINDS = ('fill-image', 'fill-imgmask', 'fill-shade')
+# 矢量检测规则的版本，规则改变时加一，作为缓存键的一部分使旧的检测结果失效
+VECTOR_DETECT_VERSION = 3
+# 显示列表条目数超过该值时不做矢量检测：逐个解析路径的耗时随条目数增长，
+# 密集的散点图等页面比渲染检测慢数倍
+VECTOR_MAX_ITEMS = 300
+
+
+def _color_brightness(color, opacity):
+    """估算颜色画在白底上的亮度（0-255）"""
+    if len(color) == 4:
+        c, m, y, k = color
+        color = ((1 - c) * (1 - k), (1 - m) * (1 - k), (1 - y) * (1 - k))
+    brightness = 255 * sum(color) / len(color)
+    if opacity is None:
+        opacity = 1.0
+    return 255 - (255 - brightness) * opacity
+
+
+def _is_invisible_path(kind, path, threshold):
+    """判断路径是否在白底上不可见（无颜色、全透明或接近白色）"""
+    if kind == 'fill-path':
+        color, opacity = path.get('fill'), path.get('fill_opacity')
+    else:
+        color, opacity = path.get('color'), path.get('stroke_opacity')
+    if not color or opacity == 0:
+        return True
+    return _color_brightness(color, opacity) >= threshold
+
+
+def _collect_paths(page):
+    """返回 ({seqno: 路径}, {seqno: 路径所在的裁剪层})。
+
+    裁剪层为外层到内层的 (序号, 裁剪范围) 元组，没有裁剪时为空元组；
+    get_drawings(extended=True) 中的条目按 level 嵌套，裁剪和透明组都会加深一层。
+    """
+    drawings = {}
+    clip_stacks = {}
+    stack = []
+    for index, item in enumerate(page.get_drawings(extended=True)):
+        del stack[item['level']:]
+        if item['type'] == 'clip':
+            stack.append((index, fitz.Rect(item['scissor'])))
+        elif item['type'] == 'group':
+            stack.append((index, None))
+        else:
+            drawings[item['seqno']] = item
+            clip_stacks[item['seqno']] = tuple(stack)
+    return drawings, clip_stacks
+
+
+def _clip_rect(clip_stack):
+    """裁剪层的有效范围，没有裁剪时为 None"""
+    rects = [scissor for _, scissor in clip_stack if scissor is not None]
+    if not rects:
+        return None
+    clip = rects[0]
+    for scissor in rects[1:]:
+        clip = clip & scissor
+    return clip
+
+
+def _neighbor_clip_stack(clip_stacks, seqnos, index):
+    """文字、图片等不在 get_drawings 中，按前后相邻路径推断其所在的裁剪层。
+
+    前后两条路径的裁剪层完全相同时，中间不可能有裁剪的开始或结束，可以确定；
+    否则无法确定，按没有裁剪处理（范围只会偏大，不会裁掉内容）。
+    """
+    position = bisect.bisect_left(seqnos, index)
+    before = clip_stacks[seqnos[position - 1]] if position > 0 else ()
+    after = clip_stacks[seqnos[position]] if position < len(seqnos) else ()
+    return before if before == after else ()
+
+
+def _lookup_path(drawings, kind, index):
+    """找到显示列表第 index 条对应的路径；同时填充和描边的路径在显示列表中占两条"""
+    path = drawings.get(index)
+    if kind == 'fill-path':
+        return path if path is not None and 'f' in path['type'] else None
+    if path is not None and path['type'] == 's':
+        return path
+    path = drawings.get(index - 1)
+    return path if path is not None and path['type'] == 'fs' else None
+
+
+def detect_page_bbox_vector(page, threshold=PDF_THRESHOLD):
+    """根据页面显示列表的几何范围计算内容区域（页面坐标），不做任何渲染。
+
+    合并文字、可见路径的范围，忽略不可见或白色填充的背景矩形；
+    每个条目的范围与它所在的裁剪路径取交集（例如 matplotlib 设置坐标轴范围后
+    超出坐标区的曲线）。
+    页面含有超出矢量内容范围的图片/渐变、无法对应的路径、注释，条目数超过
+    VECTOR_MAX_ITEMS，或没有任何可见内容时返回 None，由调用方退回栅格检测。
+    """
+    if page.first_annot is not None:
+        return None
+    # 先取显示列表条目，条目过多时不再调用开销大得多的 get_drawings
+    bboxlog = page.get_bboxlog()
+    if len(bboxlog) > VECTOR_MAX_ITEMS:
+        return None
+
+    rect = page.rect
+    rotation = page.rotation_matrix
+    drawings, clip_stacks = _collect_paths(page)
+    seqnos = sorted(clip_stacks)
+
+    content_rect = fitz.Rect()
+    raster_rects = []
+    for index, (kind, bbox) in enumerate(bboxlog):
+        bbox = fitz.Rect(bbox)
+        if kind in _PATH_KINDS:
+            path = _lookup_path(drawings, kind, index)
+            if path is None:
+                return None
+            if _is_invisible_path(kind, path, threshold):
+                continue
+            # 显示列表记录的描边范围按斜接上限估算，偏大；用路径本身的范围收紧
+            half_width = (path.get('width') or 0) / 2 if kind == 'stroke-path' else 0
+            path_rect = fitz.Rect(path['rect'])
+            bbox &= fitz.Rect(
+                path_rect.x0 - half_width,
+                path_rect.y0 - half_width,
+                path_rect.x1 + half_width,
+                path_rect.y1 + half_width,
+            )
+            clip = _clip_rect(clip_stacks[path['seqno']])
+        else:
+            clip = _clip_rect(_neighbor_clip_stack(clip_stacks, seqnos, index))
+        if clip is not None:
+            bbox &= clip
+
+        bbox = (bbox * rotation) & rect
+        if bbox.is_empty:
+            continue
+
+        if kind in _RASTER_KINDS:
+            raster_rects.append(bbox)
+            continue
+        if kind not in _PATH_KINDS and kind not in _TEXT_KINDS:
+            # 不可见文字、裁剪路径等不产生墨迹
+            continue
+
+        content_rect |= bbox
+
+    if content_rect.is_empty:
+        return None
+
+    # 图片完全位于矢量内容范围之内时不影响边界
+    for bbox in raster_rects:
+        if not content_rect.contains(bbox):
+            return None
+
+    return content_rect
+
+
+def analyze_page(page, mode='raster', zoom=DETECT_ZOOM, threshold=PDF_THRESHOLD, band_bytes=RENDER_BAND_BYTES,
+                 profile=DEFAULT_RENDER_PROFILE):
+    """按检测模式计算页面内容区域（页面坐标），没有内容时返回 None"""
+    if mode == 'vector':
+        content_rect = detect_page_bbox_vector(page, threshold)
+        if content_rect is not None:
+            return content_rect
+    return detect_page_bbox(page, zoom, threshold, band_bytes, profile)
+
+
+def analyze_page_lowres(page, mode='raster', zoom=UNIFORM_ZOOM, band_bytes=RENDER_BAND_BYTES,
+                        profile=DEFAULT_RENDER_PROFILE):
+    """只做一遍低分辨率检测的内容区域（页面坐标），没有内容时返回 None。
+
+    与粗定位一样使用 COARSE_THRESHOLD，边界按像素向外取整，结果只会比
+    精确检测略大，不会裁掉内容。矢量模式能确定边界时不做渲染。
+    """
+    if mode == 'vector':
+        content_rect = detect_page_bbox_vector(page)
+        if content_rect is not None:
+            return content_rect
+
+    rect = page.rect
+    annots = RENDER_PROFILES[profile]['annots']
+    bounds, irect = scan_region(page, rect, zoom, COARSE_THRESHOLD, band_bytes, annots)
+    if bounds is None:
+        return None
+    left, top, right, bottom = bounds
+    return fitz.Rect(
+        left * rect.width / irect.width,
+        top * rect.height / irect.height,
+        (right + 1) * rect.width / irect.width,
+        (bottom + 1) * rect.height / irect.height,
+    ) & rect
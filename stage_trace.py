@@ -0,0 +1,134 @@
+"""分阶段跟踪：记录每个文件、每一页各处理阶段的耗时和内存分配峰值。
+
+处理代码只需用 ``with stage('render'):`` 包住一个阶段；当前进程没有启用
+跟踪时它什么也不做。启用时用 ``with StageTracer(文件路径) as tracer:`` 包住
+一个文件的处理过程，结束后 tracer.records 即为该文件的全部记录。
+
+内存峰值由 tracemalloc 统计，包括 Python 对象和 numpy 数组，不包括 MuPDF
+内部的 C 内存；嵌套阶段的峰值会同时计入外层阶段。
+"""
+import datetime
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+TRACE_FILENAME = "stage_trace.jsonl"
+
+# 当前进程中正在收集记录的跟踪器，以及所有未结束的阶段（外层在前）
+_active_tracer = None
+_open_stages = []
+
+
+class _OpenStage:
+    __slots__ = ('name', 'page', 'started', 'child_seconds', 'start_bytes', 'peak_bytes')
+
+    def __init__(self, name, page, start_bytes):
+        self.name = name
+        self.page = page
+        self.started = time.perf_counter()
+        self.child_seconds = 0.0
+        self.start_bytes = start_bytes
+        self.peak_bytes = start_bytes
+
+
+class StageTracer:
+    """收集一个文件（file_path 为 None 时表示整个批次的调度过程）的阶段记录"""
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.records = []
+        self._previous = None
+        self._started_tracemalloc = False
+
+    def __enter__(self):
+        global _active_tracer
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        self._previous = _active_tracer
+        _active_tracer = self
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        global _active_tracer
+        _active_tracer = self._previous
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+        return False
+
+
+@contextmanager
+def stage(name, page=None):
+    """记录一个处理阶段；page 缺省时沿用外层阶段的页码"""
+    tracer = _active_tracer
+    if tracer is None:
+        yield
+        return
+
+    # 重置峰值前先把到目前为止的峰值计入所有外层阶段
+    current, peak = tracemalloc.get_traced_memory()
+    for outer in _open_stages:
+        outer.peak_bytes = max(outer.peak_bytes, peak)
+    tracemalloc.reset_peak()
+
+    if page is None and _open_stages:
+        page = _open_stages[-1].page
+    opened = _OpenStage(name, page, current)
+    _open_stages.append(opened)
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - opened.started
+        _open_stages.pop()
+        opened.peak_bytes = max(opened.peak_bytes, tracemalloc.get_traced_memory()[1])
+        if _open_stages:
+            parent = _open_stages[-1]
+            parent.child_seconds += seconds
+            parent.peak_bytes = max(parent.peak_bytes, opened.peak_bytes)
+
+        tracer.records.append({
+            'file': tracer.file_path,
+            'page': page,
+            'stage': name,
+            'seconds': round(seconds, 6),
+            'self_seconds': round(seconds - opened.child_seconds, 6),
+            'peak_bytes': opened.peak_bytes - opened.start_bytes,
+        })
+
+
+def add_records(records):
+    """把工作进程中收集的记录并入当前跟踪器"""
+    if _active_tracer is not None:
+        _active_tracer.records.extend(records)
+
+
+def append_trace(path, records):
+    """以 JSON Lines 格式追加写入一个批次的跟踪记录，每条记录带上批次开始时间作为标识"""
+    batch = datetime.datetime.now().isoformat(timespec='seconds')
+    with open(path, 'a', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(dict(record, batch=batch), ensure_ascii=False) + "\n")
+
+
+def summarize_trace(records, limit=4):
+    """按阶段汇总各文件的独占耗时和内存峰值，返回一行文字，没有记录时返回空字符串。
+
+    批次调度记录（file 为 None）与各文件的处理时间重叠，不计入汇总。
+    """
+    totals = {}
+    peaks = {}
+    for record in records:
+        if record['file'] is None:
+            continue
+        totals[record['stage']] = totals.get(record['stage'], 0.0) + record['self_seconds']
+        peaks[record['stage']] = max(peaks.get(record['stage'], 0), record['peak_bytes'])
+    if not totals:
+        return ""
+
+    ranked = sorted(totals, key=totals.get, reverse=True)
+    parts = [f"{name} {totals[name]:.2f}s" for name in ranked[:limit]]
+    if len(ranked) > limit:
+        parts.append(f"其他 {sum(totals[name] for name in ranked[limit:]):.2f}s")
+    peak_stage = max(peaks, key=peaks.get)
+    return f"阶段耗时: {', '.join(parts)}; 内存峰值 {peaks[peak_stage] / (1 << 20):.1f} MB ({peak_stage})"